@@ -1,3 +1,5 @@
+import time
+_STARTUP_T0 = time.perf_counter()
 import dash
 from dash import dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
@@ -5,44 +7,187 @@ import json
 import re
 import io
 from contextlib import redirect_stdout
-from langchain_openai import ChatOpenAI
-from langchain_community.graphs import Neo4jGraph
-from langchain_classic.chains import GraphCypherQAChain
-from langchain_classic.prompts import PromptTemplate, FewShotPromptTemplate
+# langchain (ChatOpenAI, Neo4jGraph, the classic chain stack) and requests are imported on first use
 from neo4j import GraphDatabase
+from neo4j.exceptions import CypherSyntaxError, Neo4jError
+from neo4j.graph import Node, Relationship, Path
+import neo4j.time as neo4j_time
+import neo4j.spatial as neo4j_spatial
 import dotenv
 import certifi
 import os
+import sys
+import atexit
+import threading
+import hashlib
+import math
+import difflib
+import bisect
+import uuid
+import sqlite3
+from collections import Counter, OrderedDict, deque
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import dash_cytoscape as cyto
-import requests
-from requests.auth import HTTPBasicAuth
+from flask import jsonify
 import neo4j as neo4j_mod
-
-
-
-# Load examples from the JSON file
+import plotly.io as pio
+try:
+    import orjson
+except ImportError:  # stdlib json fallback, same output shape
+    orjson = None
+
+# Where module load time goes (import-time work is kept cheap; clients connect on first use)
+STARTUP_REPORT = {"phases_s": {}, "lazy_init_s": {}}
+
+
+def _startup_mark(phase):
+    """Record the time since the first import line (seconds) at the end of a load phase."""
+    STARTUP_REPORT["phases_s"][phase] = round(time.perf_counter() - _STARTUP_T0, 3)
+
+
+_startup_mark("imports")
+
+
+
+# ---- approved example store ----
+# Approved examples live in an append-only SQLite database (WAL mode) next to the JSON file
+# (cypher_examples.json -> cypher_examples.db). The JSON file is imported once on first open and
+# is otherwise only the seed; rows are deduplicated on (normalized question, normalized Cypher).
+# Every example is also kept in memory, so reading them never re-parses or re-queries the disk
+# unless another process has committed new rows (checked via PRAGMA data_version).
+class ExampleStore:
+    def __init__(self, db_path, json_path=None):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.lock = threading.Lock()
+        self.conn = None
+        self.examples = []      # hot index: [{"question", "cypher"}] in insertion order
+        self.keys = set()       # (normalized question, normalized cypher)
+        self.last_id = 0
+        self.data_version = None
+
+    @staticmethod
+    def _key(question, cypher):
+        return normalize_question(question), normalize_cypher(cypher)
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS examples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                cypher TEXT NOT NULL,
+                question_norm TEXT NOT NULL,
+                cypher_norm TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (question_norm, cypher_norm)
+            )""")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    def _insert_many(self, pairs):
+        """INSERT OR IGNORE (question, cypher) pairs in one transaction; returns rows added."""
+        rows = []
+        for question, cypher in pairs:
+            question, cypher = (question or "").strip(), (cypher or "").strip()
+            if question and cypher:
+                rows.append((question, cypher, *self._key(question, cypher), time.time()))
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO examples (question, cypher, question_norm, cypher_norm, created_at) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            added = self.conn.total_changes - before
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def _refresh(self, force=False):
+        """Pull rows committed since the last read (by us or another process) into the hot index."""
+        # data_version only moves when *another* connection commits; our own inserts pass force=True
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version and not force:
+            return
+        for row_id, question, cypher, q_norm, c_norm in self.conn.execute(
+                "SELECT id, question, cypher, question_norm, cypher_norm FROM examples WHERE id > ? ORDER BY id",
+                (self.last_id,)):
+            self.examples.append({"question": question, "cypher": cypher})
+            self.keys.add((q_norm, c_norm))
+            self.last_id = row_id
+        self.data_version = version
+
+    def _ensure_open(self):
+        if self.conn is not None:
+            return
+        self.conn = self._open()
+        if self.json_path:
+            self.import_json(self.json_path, _locked=True)
+        self._refresh(force=True)
+
+    def import_json(self, json_path, _locked=False):
+        """Import a cypher_examples.json file once (recorded in the meta table); returns rows added."""
+        if not _locked:
+            with self.lock:
+                self._ensure_open()
+                return self.import_json(json_path, _locked=True)
+        marker = "imported:" + os.path.abspath(json_path)
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return 0
+        try:
+            with open(json_path, 'r') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return 0
+        added = self._insert_many((ex.get("question"), ex.get("cypher")) for ex in data.get("examples", []))
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (marker, str(time.time())))
+        print(f"[examples] imported {added} examples from {json_path} into {self.db_path}")
+        return added
+
+    def add(self, question, cypher):
+        """Append one approved example; returns False if it is a duplicate."""
+        with self.lock:
+            self._ensure_open()
+            if self._key(question, cypher) in self.keys:
+                return False
+            added = self._insert_many([(question, cypher)])
+            self._refresh(force=True)
+            return bool(added)
+
+    def all(self):
+        with self.lock:
+            self._ensure_open()
+            self._refresh()
+            return list(self.examples)
+
+
+_EXAMPLE_STORES = {}
+_EXAMPLE_STORES_LOCK = threading.Lock()
+
+
+def example_store(file_path):
+    """The ExampleStore backing a cypher_examples.json path (its .db sibling)."""
+    with _EXAMPLE_STORES_LOCK:
+        store = _EXAMPLE_STORES.get(file_path)
+        if store is None:
+            store = _EXAMPLE_STORES[file_path] = ExampleStore(os.path.splitext(file_path)[0] + ".db", file_path)
+        return store
+
+
+# Load examples from the example store
 def load_examples(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            examples_data = json.load(file)
-            examples = examples_data.get('examples', [])
-            updated_examples = [{"example question": ex.get("question", "No question found"), "example cypher": ex.get("cypher", "No cypher found")} for ex in examples]
-            return updated_examples
-    except FileNotFoundError:
-        return []
+    return [{"example question": ex["question"], "example cypher": ex["cypher"]}
+            for ex in example_store(file_path).all()]
 
-# Save examples to the JSON file
+# Save an approved example to the example store (duplicates are ignored)
 def save_example(file_path, question, cypher):
-    try:
-        with open(file_path, 'r') as file:
-            examples_data = json.load(file)
-    except FileNotFoundError:
-        examples_data = {"examples": []}
-    
-    examples_data['examples'].append({"question": question, "cypher": cypher})
-    
-    with open(file_path, 'w') as file:
-        json.dump(examples_data, file, indent=4)
+    return example_store(file_path).add(question, cypher)
 
 # Define the path to the examples JSON file
 EXAMPLES_FILE_PATH = 'cypher_examples.json'
@@ -67,15 +212,164 @@ NEO4J_USERNAME_2 = os.getenv("NEO4J_USERNAME_2")
 NEO4J_PASSWORD_2 = os.getenv("NEO4J_PASSWORD_2")
 NEO4J_HTTP_URI_2 = os.getenv("NEO4J_HTTP_URI_2", "http://localhost:7474")
 
+# KG connection details keyed by the ids used in the KG selector dropdown
+KG_CONFIGS = {
+    "kg1": {
+        "uri": NEO4J_URI, "username": NEO4J_USERNAME, "password": NEO4J_PASSWORD,
+        "http_uri": NEO4J_HTTP_URI, "name": "COVID–NDD CBM KG",
+        "query_timeout_s": float(os.getenv("NEO4J_QUERY_TIMEOUT_S", "60")),
+    },
+    "kg2": {
+        "uri": NEO4J_URI_2, "username": NEO4J_USERNAME_2, "password": NEO4J_PASSWORD_2,
+        "http_uri": NEO4J_HTTP_URI_2, "name": "COVID–NDD Negin KG",
+        "query_timeout_s": float(os.getenv("NEO4J_QUERY_TIMEOUT_S_2", os.getenv("NEO4J_QUERY_TIMEOUT_S", "60"))),
+    },
+}
+
+# Connection pool settings shared by every helper that talks to Neo4j
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "20"))
+NEO4J_LIVENESS_CHECK_S = float(os.getenv("NEO4J_LIVENESS_CHECK_S", "30"))
+NEO4J_ACQUIRE_TIMEOUT_S = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT_S", "60"))
+
+
+def kg_id_for_uri(uri):
+    """Map a Bolt URI back to its KG id (kg1/kg2). Unknown URIs are keyed by the URI itself."""
+    for kg_id, cfg in KG_CONFIGS.items():
+        if cfg["uri"] and cfg["uri"] == uri:
+            return kg_id
+    return uri
+
+
+# ---- pooled driver registry ----
+class _PooledDriver:
+    """
+    One long-lived driver per KG, plus the bookkeeping behind pool_metrics().
+    Sessions are handed out through kg_session(); each open session holds one slot,
+    so 'in_use' and the acquisition wait reflect real contention on the pool.
+    """
+
+    def __init__(self, kg_id, uri, username, password):
+        self.kg_id = kg_id
+        self.credentials = (uri, username, password)
+        self.driver = GraphDatabase.driver(
+            uri,
+            auth=(username, password),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            liveness_check_timeout=NEO4J_LIVENESS_CHECK_S,
+            connection_acquisition_timeout=NEO4J_ACQUIRE_TIMEOUT_S,
+        )
+        self.slots = threading.BoundedSemaphore(NEO4J_MAX_POOL_SIZE)
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.acquired = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def acquire(self):
+        t0 = time.perf_counter()
+        if not self.slots.acquire(timeout=NEO4J_ACQUIRE_TIMEOUT_S):
+            raise TimeoutError(f"No free Neo4j connection for {self.kg_id} after {NEO4J_ACQUIRE_TIMEOUT_S}s")
+        waited = time.perf_counter() - t0
+        with self.lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_total_s += waited
+            self.wait_max_s = max(self.wait_max_s, waited)
+
+    def release(self):
+        with self.lock:
+            self.in_use -= 1
+        self.slots.release()
+
+    def idle_connections(self):
+        # The driver does not expose pool stats publicly; read them best-effort.
+        conns = getattr(getattr(self.driver, "_pool", None), "connections", None)
+        if conns is None:
+            return None
+        try:
+            return sum(1 for q in list(conns.values()) for c in list(q) if not getattr(c, "in_use", False))
+        except Exception:
+            return None
+
+    def metrics(self):
+        with self.lock:
+            avg_ms = (self.wait_total_s / self.acquired * 1000) if self.acquired else 0.0
+            return {
+                "uri": self.credentials[0],
+                "max_pool_size": NEO4J_MAX_POOL_SIZE,
+                "in_use": self.in_use,
+                "idle": self.idle_connections(),
+                "acquired_total": self.acquired,
+                "acquire_wait_avg_ms": round(avg_ms, 3),
+                "acquire_wait_max_ms": round(self.wait_max_s * 1000, 3),
+            }
+
+
+_DRIVERS = {}
+_DRIVERS_LOCK = threading.Lock()
+
+
+def _pooled_driver(uri, username, password):
+    kg_id = kg_id_for_uri(uri)
+    with _DRIVERS_LOCK:
+        entry = _DRIVERS.get(kg_id)
+        if entry is not None and entry.credentials != (uri, username, password):
+            # credentials changed (e.g. rotated password) -> replace the driver
+            entry.driver.close()
+            entry = None
+        if entry is None:
+            entry = _PooledDriver(kg_id, uri, username, password)
+            _DRIVERS[kg_id] = entry
+        return entry
+
+
+def get_driver(uri, username, password):
+    """Return the shared, pooled driver for this KG (created on first use)."""
+    return _pooled_driver(uri, username, password).driver
+
+
+@contextmanager
+def kg_session(uri, username, password, **session_kwargs):
+    """
+    Open a session on the shared driver for this KG, tracking pool usage.
+    Don't open a second one while holding one: both take a pool slot, so a full pool deadlocks.
+    """
+    entry = _pooled_driver(uri, username, password)
+    entry.acquire()
+    try:
+        with entry.driver.session(**session_kwargs) as session:
+            yield session
+    finally:
+        entry.release()
+
+
+def pool_metrics():
+    """Per-KG pool metrics (in-use sessions, idle connections, acquisition wait)."""
+    with _DRIVERS_LOCK:
+        entries = list(_DRIVERS.items())
+    return {kg_id: entry.metrics() for kg_id, entry in entries}
+
+
+def close_all_drivers():
+    with _DRIVERS_LOCK:
+        entries = list(_DRIVERS.values())
+        _DRIVERS.clear()
+    for entry in entries:
+        try:
+            entry.driver.close()
+        except Exception as e:
+            print(f"⚠️ Error closing Neo4j driver for {entry.kg_id}: {e}")
+
+
+atexit.register(close_all_drivers)
+
 # Function to retrieve relationship details
 #def extract_schema():
 def extract_schema(uri, username, password):
 
     try:
         #driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-        driver = GraphDatabase.driver(uri, auth=(username, password))
-
-        with driver.session() as session:
+        with kg_session(uri, username, password) as session:
             # Extract Nodes & Properties
             node_query = """
             CALL db.schema.nodeTypeProperties()
@@ -93,17 +387,12 @@ def extract_schema(uri, username, password):
             node_schema = session.run(node_query).data()
         
             
-            # Extract Relationships
-            rel_query = """
-            MATCH ()-[r]->()
-            WITH DISTINCT type(r) AS relType, keys(r) AS properties
-            UNWIND properties AS property
-            WITH relType, COLLECT(DISTINCT property) AS uniqueProps
-            WITH relType, [p IN uniqueProps WHERE p IN ["source", "citationType", "pmid", "citationRef", "evidence"]] AS filteredProps
-            RETURN relType, filteredProps
-            ORDER BY relType;
-            """
-            rel_schema = session.run(rel_query).data()
+            # Extract Relationships (schema procedure first; per-type sampling if unavailable)
+            try:
+                rel_schema = _rel_schema_from_procedure(session)
+            except Exception as e:
+                print(f"⚠️ db.schema.relTypeProperties() failed ({e}); sampling relationships instead")
+                rel_schema = _rel_schema_from_sample(session)
             
             
             # Directionality
@@ -114,8 +403,6 @@ def extract_schema(uri, username, password):
             # """
             # dir_schema = session.run(dir_query).data()
         
-        driver.close()
-        
         print("\n🔹 Extracted Nodes Schema:")
         for node in node_schema:
             print(f"  - {node['NodeLabel']} → Properties: {', '.join(node['Properties'])}")
@@ -143,6 +430,185 @@ def extract_schema(uri, username, password):
 
 
 
+# Relationship properties worth showing to the LLM
+REL_SCHEMA_PROPS = ["source", "citationType", "pmid", "citationRef", "evidence"]
+SCHEMA_REL_SAMPLE = int(os.getenv("CGEX_SCHEMA_REL_SAMPLE", "200"))
+
+
+def _strip_schema_type(t):
+    """db.schema.* procedures report types as ':`TYPE`' -> 'TYPE'."""
+    t = str(t or "")
+    if t.startswith(":"):
+        t = t[1:]
+    return t.strip("`")
+
+
+def _filtered_rel_schema(props_by_type):
+    # Same shape as the old full-scan query: only types that carry properties, sorted by type.
+    return [
+        {"relType": rel_type, "filteredProps": [p for p in props if p in REL_SCHEMA_PROPS]}
+        for rel_type, props in sorted(props_by_type.items())
+        if props
+    ]
+
+
+def _rel_schema_from_procedure(session):
+    """Relationship types/properties from the schema procedure (no relationship scan)."""
+    props_by_type = {}
+    for rec in session.run(
+        "CALL db.schema.relTypeProperties() YIELD relType, propertyName RETURN relType, propertyName"
+    ):
+        rel_type = _strip_schema_type(rec["relType"])
+        props = props_by_type.setdefault(rel_type, [])
+        if rec["propertyName"] and rec["propertyName"] not in props:
+            props.append(rec["propertyName"])
+    return _filtered_rel_schema(props_by_type)
+
+
+def _rel_schema_from_sample(session, sample=SCHEMA_REL_SAMPLE):
+    """Relationship types/properties from the first `sample` relationships of each type."""
+    rel_types = [r["relationshipType"] for r in session.run("CALL db.relationshipTypes() YIELD relationshipType")]
+    props_by_type = {}
+    for rel_type in rel_types:
+        escaped = rel_type.replace("`", "``")
+        rec = session.run(
+            f"MATCH ()-[r:`{escaped}`]->() WITH r LIMIT $sample "
+            "UNWIND keys(r) AS k RETURN collect(DISTINCT k) AS props",
+            sample=sample,
+        ).single()
+        props_by_type[rel_type] = list(rec["props"]) if rec else []
+    return _filtered_rel_schema(props_by_type)
+
+
+# ---- schema cache ----
+# Schemas are cached per KG. Fresh entries are served as-is; stale entries are served
+# immediately while a background thread re-extracts them, so only the very first request
+# for a KG (or one after invalidate_schema) waits for schema discovery.
+SCHEMA_CACHE_TTL_S = float(os.getenv("CGEX_SCHEMA_TTL_S", "900"))
+SCHEMA_REFRESH_INTERVAL_S = float(os.getenv("CGEX_SCHEMA_REFRESH_S", "0"))  # 0 = no periodic refresher
+
+_SCHEMA_CACHE = {}          # kg_id -> {"schema", "fingerprint", "fetched_at"}
+_SCHEMA_REFRESHING = set()  # kg_ids with a background refresh in flight
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_FETCH_LOCKS = {}    # kg_id -> lock serializing that KG's first (blocking) extraction
+
+
+def schema_fingerprint(schema):
+    """Stable short hash of an extracted schema (changes whenever the schema does)."""
+    payload = json.dumps({"nodes": schema.get("nodes", []), "relationships": schema.get("relationships", [])},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _refresh_schema(uri, username, password):
+    kg_id = kg_id_for_uri(uri)
+    try:
+        t0 = time.perf_counter()
+        schema = extract_schema(uri, username, password)
+        if not schema.get("nodes") and not schema.get("relationships"):
+            # extraction failed (already logged) -> keep serving what we have
+            return _SCHEMA_CACHE.get(kg_id)
+        entry = {"schema": schema, "fingerprint": schema_fingerprint(schema), "fetched_at": time.time()}
+        with _SCHEMA_LOCK:
+            prev = _SCHEMA_CACHE.get(kg_id)
+            _SCHEMA_CACHE[kg_id] = entry
+        if prev and prev["fingerprint"] != entry["fingerprint"]:
+            print(f"[schema] {kg_id} schema changed {prev['fingerprint']} → {entry['fingerprint']}")
+            RESULT_CACHE.invalidate_kg(kg_id)
+            invalidate_label_cache(kg_id)
+            invalidate_gazetteer(kg_id)
+        print(f"[schema] {kg_id} extracted in {time.perf_counter() - t0:.2f}s")
+        return entry
+    finally:
+        with _SCHEMA_LOCK:
+            _SCHEMA_REFRESHING.discard(kg_id)
+
+
+def get_schema_entry(uri, username, password):
+    """Cached schema entry ({"schema", "fingerprint", "fetched_at"}) for this KG."""
+    kg_id = kg_id_for_uri(uri)
+    with _SCHEMA_LOCK:
+        entry = _SCHEMA_CACHE.get(kg_id)
+        stale = entry is not None and time.time() - entry["fetched_at"] > SCHEMA_CACHE_TTL_S
+        start_refresh = stale and kg_id not in _SCHEMA_REFRESHING
+        if start_refresh:
+            _SCHEMA_REFRESHING.add(kg_id)
+
+    if entry is None:
+        with _SCHEMA_LOCK:
+            fetch_lock = _SCHEMA_FETCH_LOCKS.setdefault(kg_id, threading.Lock())
+        # per KG, so a slow or unreachable KG never holds up another KG's first fetch
+        with fetch_lock:
+            entry = _SCHEMA_CACHE.get(kg_id) or _refresh_schema(uri, username, password)
+        if entry is None:
+            return {"schema": {"nodes": [], "relationships": [], "directionality": []},
+                    "fingerprint": None, "fetched_at": 0}
+    elif start_refresh:
+        threading.Thread(target=_refresh_schema, args=(uri, username, password),
+                         name=f"schema-refresh-{kg_id}", daemon=True).start()
+    return entry
+
+
+def peek_schema_entry(kg_id):
+    """Cached schema entry for a KG without ever triggering extraction (None if not cached)."""
+    with _SCHEMA_LOCK:
+        return _SCHEMA_CACHE.get(kg_id)
+
+
+def get_schema(uri, username, password):
+    """Cached drop-in for extract_schema()."""
+    return get_schema_entry(uri, username, password)["schema"]
+
+
+def schema_labels(schema):
+    """Individual node labels in an extracted schema (nodeType ':`A`:`B`' → ['A', 'B'])."""
+    labels = set()
+    for item in schema.get("nodes", []):
+        for part in re.findall(r"`((?:[^`]|``)+)`", str(item.get("NodeLabel") or "")):
+            labels.add(part.replace("``", "`"))
+    return sorted(labels)
+
+
+def cypher_label(label):
+    """Backtick-quote a label/type for safe use in generated Cypher."""
+    return "`" + str(label).replace("`", "``") + "`"
+
+
+def invalidate_schema(kg_id=None):
+    """Drop the cached schema of one KG (or all KGs); the next request re-extracts it."""
+    with _SCHEMA_LOCK:
+        if kg_id is None:
+            _SCHEMA_CACHE.clear()
+        else:
+            _SCHEMA_CACHE.pop(kg_id, None)
+
+
+def start_schema_refresher(interval_s=SCHEMA_REFRESH_INTERVAL_S):
+    """Re-extract the schema of every configured KG every `interval_s` seconds in a daemon thread."""
+    if interval_s <= 0:
+        return None
+
+    def _loop():
+        while True:
+            for kg_id, cfg in KG_CONFIGS.items():
+                if not cfg["uri"]:
+                    continue
+                with _SCHEMA_LOCK:
+                    if kg_id in _SCHEMA_REFRESHING:
+                        continue
+                    _SCHEMA_REFRESHING.add(kg_id)
+                _refresh_schema(cfg["uri"], cfg["username"], cfg["password"])
+            time.sleep(interval_s)
+
+    t = threading.Thread(target=_loop, name="schema-refresher", daemon=True)
+    t.start()
+    return t
+
+
+# Line that introduces the user question at the end of the built template
+QUESTION_LEAD = "Now generate a Cypher query for this question:"
+
+
 #def build_prompt_template(node_schema, rel_schema):
 def build_prompt_template(node_schema, rel_schema, kg_name="Selected KG"):
 
@@ -235,13 +701,49 @@ RETURN c, r, d, r2, e LIMIT 5
 Do NOT add extra text like "Example:", "Cypher:", "---", etc., to the actual Cypher query.
 
 
-Now generate a Cypher query for this question:
+{QUESTION_LEAD}
 {{question}}
 
 """
+    from langchain_core.prompts import PromptTemplate
     return PromptTemplate(template=template, input_variables=["question"])
 
 
+# ---- prompt template cache ----
+# Rendered templates are reused per (KG, schema fingerprint, kg_name): identical schemas get the
+# very same object, and its text stays byte-identical between requests.
+_PROMPT_CACHE = {}
+_PROMPT_CACHE_LOCK = threading.Lock()
+
+
+def get_prompt_template(uri, username, password, kg_name="Selected KG"):
+    """Memoized build_prompt_template() for this KG's (cached) schema."""
+    entry = get_schema_entry(uri, username, password)
+    kg_id = kg_id_for_uri(uri)
+    key = (kg_id, entry["fingerprint"], kg_name)
+    with _PROMPT_CACHE_LOCK:
+        cached = _PROMPT_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    schema = entry["schema"]
+    template = build_prompt_template(schema["nodes"], schema["relationships"], kg_name=kg_name)
+    if entry["fingerprint"] is not None:  # never pin the empty fallback schema
+        with _PROMPT_CACHE_LOCK:
+            # drop templates rendered from older schemas of this KG
+            for old_key in [k for k in _PROMPT_CACHE if k[0] == kg_id and k[1] != entry["fingerprint"]]:
+                del _PROMPT_CACHE[old_key]
+            template = _PROMPT_CACHE.setdefault(key, template)
+    return template
+
+
+def splice_question(prompt_template, question):
+    """Insert the question into a built template by plain splicing (no re-rendering)."""
+    text = getattr(prompt_template, "template", None) or str(prompt_template)
+    head, sep, tail = text.partition("{question}")
+    return head + question + tail if sep else text
+
+
 # Extract schema dynamically
 # try:
 #     dynamic_schema = extract_schema()
@@ -345,13 +847,33 @@ Now generate a Cypher query for this question:
 # """
 
 
-# Initialize the OpenAI API
+# Initialize the OpenAI API (lazily: the client and its imports are created on first use)
 # llm = OpenAI(openai_api_key=OPENAI_API_KEY)
-llm = ChatOpenAI(
-    model="gpt-5",
-    openai_api_key=OPENAI_API_KEY,
-    model_kwargs={"response_format": {"type": "text"}}  # force text
-)
+_LLM = None
+_LAZY_INIT_LOCK = threading.Lock()
+
+
+def _record_lazy_init(name, t0):
+    STARTUP_REPORT["lazy_init_s"][name] = round(time.perf_counter() - t0, 3)
+    print(f"[startup] {name} initialised on first use in {STARTUP_REPORT['lazy_init_s'][name]}s")
+
+
+def get_llm():
+    """The shared ChatOpenAI client, created on first use."""
+    global _LLM
+    if _LLM is None:
+        with _LAZY_INIT_LOCK:
+            if _LLM is None:
+                t0 = time.perf_counter()
+                from langchain_openai import ChatOpenAI
+                _LLM = ChatOpenAI(
+                    model="gpt-5",
+                    openai_api_key=OPENAI_API_KEY,
+                    model_kwargs={"response_format": {"type": "text"}},  # force text
+                    stream_usage=True,  # token usage on streamed responses too
+                )
+                _record_lazy_init("llm", t0)
+    return _LLM
 
 
 # cypher_generation_prompt = PromptTemplate(
@@ -369,9 +891,34 @@ llm = ChatOpenAI(
 # Set the SSL_CERT_FILE environment variable
 os.environ["SSL_CERT_FILE"] = certifi.where()
 
-# Connect to both graphs
-graph_1 = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
-graph_2 = Neo4jGraph(url=NEO4J_URI_2, username=NEO4J_USERNAME_2, password=NEO4J_PASSWORD_2)
+# Langchain Neo4jGraph wrappers for the legacy chain path (query_kg) only; created on first use
+# because Neo4jGraph connects and introspects the schema in its constructor.
+_LEGACY_GRAPHS = {}
+
+
+def legacy_graph(kg_id):
+    """Neo4jGraph for a KG id (kg1/kg2), connected on first use."""
+    graph = _LEGACY_GRAPHS.get(kg_id)
+    if graph is None:
+        with _LAZY_INIT_LOCK:
+            graph = _LEGACY_GRAPHS.get(kg_id)
+            if graph is None:
+                t0 = time.perf_counter()
+                from langchain_community.graphs import Neo4jGraph
+                cfg = KG_CONFIGS[kg_id]
+                graph = _LEGACY_GRAPHS[kg_id] = Neo4jGraph(url=cfg["uri"], username=cfg["username"],
+                                                           password=cfg["password"])
+                _record_lazy_init(f"neo4jgraph_{kg_id}", t0)
+    return graph
+
+
+def _legacy_credentials(graph):
+    """(uri, username, password) of the KG a legacy Neo4jGraph was created for."""
+    kg_id = next((k for k, g in _LEGACY_GRAPHS.items() if g is graph), None)
+    if kg_id is None:
+        raise ValueError(f"Unknown legacy graph {graph!r}: not created through legacy_graph()")
+    cfg = KG_CONFIGS[kg_id]
+    return cfg["uri"], cfg["username"], cfg["password"]
 
 
 # Chains for each KG
@@ -488,10 +1035,9 @@ def query_kg(prompt, graph, cypher_chain, use_few_shot=False, prompt_str=None):
         #     generated_cypher = None
         
         if use_few_shot:
-                if graph == graph_1:
-                    uri, username, password = NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
-                else:
-                   uri, username, password = NEO4J_URI_2, NEO4J_USERNAME_2, NEO4J_PASSWORD_2
+                from langchain_core.prompts import PromptTemplate, FewShotPromptTemplate
+                from langchain_classic.chains import GraphCypherQAChain
+                uri, username, password = _legacy_credentials(graph)
                 schema = extract_schema(uri, username, password)
                 base_prompt = build_prompt_template(schema["nodes"], schema["relationships"])
                 examples = load_examples(EXAMPLES_FILE_PATH)
@@ -507,7 +1053,7 @@ def query_kg(prompt, graph, cypher_chain, use_few_shot=False, prompt_str=None):
                 example_separator="\n\n"
             )
                 cypher_chain_instance = GraphCypherQAChain.from_llm(
-                    llm, graph=graph, cypher_prompt=example_prompt_template,
+                    get_llm(), graph=graph, cypher_prompt=example_prompt_template,
                     verbose=True, allow_dangerous_requests=True, return_intermediate_steps=True
             )
                 response = cypher_chain_instance.invoke(inputs)
@@ -559,7 +1105,7 @@ def query_kg(prompt, graph, cypher_chain, use_few_shot=False, prompt_str=None):
     
         if not generated_cypher:
             prompt_for_chain = example_prompt_template if use_few_shot else (prompt_str or "")
-            generated_cypher = generate_cypher_fallback(llm, prompt_for_chain, prompt)
+            generated_cypher = generate_cypher_fallback(get_llm(), prompt_for_chain, prompt)
             if generated_cypher:
                 generated_cypher = re.sub(r"\s+", " ", generated_cypher.replace("\n", " ")).strip()
 
@@ -579,14 +1125,12 @@ def query_kg(prompt, graph, cypher_chain, use_few_shot=False, prompt_str=None):
         
         if generated_cypher:
             # Dynamically choose the right credentials
-            if graph == graph_1:
-                uri, username, password = NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
-            else:
-                uri, username, password = NEO4J_URI_2, NEO4J_USERNAME_2, NEO4J_PASSWORD_2
+            uri, username, password = _legacy_credentials(graph)
 
+            generated_cypher, _ = guard_cypher(generated_cypher, uri, username, password)
             results = execute_cypher(generated_cypher, uri, username, password)
             detailed_response = generate_detailed_response(results)
-            return str(cypher_prompt), generated_cypher, json.dumps(results, indent=2), detailed_response
+            return str(cypher_prompt), generated_cypher, safe_json(results), detailed_response
 
         return str(cypher_prompt), generated_cypher, None, None
 
@@ -596,17 +1140,320 @@ def query_kg(prompt, graph, cypher_chain, use_few_shot=False, prompt_str=None):
     
         
 
+# ---- streamed read transactions for generated queries ----
+# Generated Cypher runs in an explicit read transaction with a server-side timeout (per KG, see
+# KG_CONFIGS). Records are streamed lazily and stop at a row cap and an approximate byte cap,
+# so a large result never has to be materialised in the web process. Each transaction is tagged
+# in its metadata so a cancelled job can TERMINATE its query on the server instead of waiting.
+QUERY_MAX_ROWS = int(os.getenv("CGEX_QUERY_MAX_ROWS", "5000"))
+QUERY_MAX_BYTES = int(os.getenv("CGEX_QUERY_MAX_MB", "16")) * 1024 * 1024
+DEFAULT_QUERY_TIMEOUT_S = 60.0
+
+_INFLIGHT_QUERIES = {}   # tag -> (cancel_event, uri, username, password)
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def kg_query_timeout(uri):
+    """Server-side transaction timeout (seconds) for generated queries on this KG."""
+    cfg = KG_CONFIGS.get(kg_id_for_uri(uri)) or {}
+    return cfg.get("query_timeout_s") or DEFAULT_QUERY_TIMEOUT_S
+
+
+def _collect_entities(value, nodes, rels):
+    """Gather Node/Relationship objects (also inside paths, lists and maps) keyed by element id."""
+    if isinstance(value, Node):
+        nodes.setdefault(value.element_id, value)
+    elif isinstance(value, Relationship):
+        rels.setdefault(value.element_id, value)
+        for end in (value.start_node, value.end_node):
+            if end is not None:
+                nodes.setdefault(end.element_id, end)
+    elif isinstance(value, Path):
+        for n in value.nodes:
+            nodes.setdefault(n.element_id, n)
+        for r in value.relationships:
+            _collect_entities(r, nodes, rels)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _collect_entities(v, nodes, rels)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_entities(v, nodes, rels)
+
+
+def stream_cypher(cypher_query, uri, username, password, params=None, db=None, max_rows=None, max_bytes=None,
+                  cancel_event=None, graph=None, stats=None):
+    """
+    Generator: run a read query in an explicit read transaction (KG timeout) and yield each
+    row as record.data() while it arrives. Stops at `max_rows` rows or `max_bytes`
+    (approximate in-memory size of the yielded rows) and sets stats["truncated"].
+    If `graph=(nodes, rels)` dicts are given, the Node/Relationship entities of every yielded
+    row are collected into them (keyed by element id) along the way.
+    Raises TimeoutError when the server times the query out and PipelineCancelled when
+    `cancel_event` fires. Closing the generator early rolls the transaction back.
+    """
+    stats = {} if stats is None else stats
+    stats.update(rows=0, bytes=0, truncated=False)
+    timeout = kg_query_timeout(uri)
+    max_rows = QUERY_MAX_ROWS if max_rows is None else max_rows
+    max_bytes = QUERY_MAX_BYTES if max_bytes is None else max_bytes
+    tag = uuid.uuid4().hex
+    # READ sessions: the server rejects writes and a cluster can route the query to a read replica
+    session_kwargs = {"default_access_mode": neo4j_mod.READ_ACCESS}
+    if db:
+        session_kwargs["database"] = db
+    if cancel_event is not None:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT_QUERIES[tag] = (cancel_event, uri, username, password)
+    try:
+        with kg_session(uri, username, password, **session_kwargs) as session:
+            with session.begin_transaction(timeout=timeout, metadata={"app": "cgex", "cgex_query": tag}) as tx:
+                check_cancelled(cancel_event)
+                for record in tx.run(cypher_query, params or {}):
+                    if stats["rows"] >= max_rows:
+                        stats["truncated"] = "rows"
+                        break
+                    if stats["rows"] % 200 == 0:
+                        check_cancelled(cancel_event)
+                    row = record.data()
+                    stats["bytes"] += _approx_size(row)
+                    if stats["bytes"] > max_bytes:
+                        stats["truncated"] = "bytes"
+                        break
+                    stats["rows"] += 1
+                    if graph is not None:
+                        _collect_entities(record.values(), *graph)
+                    yield row
+                # a clean exit from the block would commit; roll back explicitly (also discards
+                # the unread records after a row/byte cap). An early close raises inside the block,
+                # which rolls back too.
+                tx.rollback()
+    except Neo4jError as e:
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled() from e
+        if "TransactionTimedOut" in (e.code or ""):
+            raise TimeoutError(f"Query exceeded the {timeout:g}s timeout on {kg_id_for_uri(uri)}; "
+                               "try a narrower question") from e
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT_QUERIES.pop(tag, None)
+        if stats["truncated"]:
+            print(f"[query] result capped after {stats['rows']} rows ({stats['truncated']} limit)")
+
+
+def run_read_query(cypher_query, uri, username, password, params=None, db=None, max_rows=None,
+                   cancel_event=None, with_graph=False):
+    """
+    stream_cypher() collected into a list.
+    Returns (rows, nodes, rels, truncated); nodes/rels map element id -> neo4j entity
+    (only filled when with_graph=True).
+    """
+    nodes, rels, stats = {}, {}, {}
+    rows = list(stream_cypher(cypher_query, uri, username, password, params=params, db=db, max_rows=max_rows,
+                              cancel_event=cancel_event, graph=(nodes, rels) if with_graph else None, stats=stats))
+    return rows, nodes, rels, bool(stats["truncated"])
+
+
+def terminate_cancelled_queries():
+    """Terminate (server-side) the transactions of queries whose cancel_event has been set."""
+    with _INFLIGHT_LOCK:
+        targets = [(tag, q) for tag, q in _INFLIGHT_QUERIES.items() if q[0].is_set()]
+    for tag, (_, uri, username, password) in targets:
+        try:
+            with kg_session(uri, username, password) as session:
+                ids = [r["transactionId"] for r in session.run(
+                    "SHOW TRANSACTIONS YIELD transactionId, metaData "
+                    "WHERE metaData.cgex_query = $tag RETURN transactionId", tag=tag)]
+                if ids:
+                    session.run("TERMINATE TRANSACTIONS $ids", ids=ids).consume()
+                    print(f"[query] terminated {ids} on {kg_id_for_uri(uri)}")
+        except Exception as e:
+            print(f"⚠️ Could not terminate cancelled query on {kg_id_for_uri(uri)}: {e}")
+
+
 # Function to execute Cypher query on Neo4j and retrieve results
-def execute_cypher(cypher_query, uri, username, password):
-    driver = GraphDatabase.driver(uri, auth=(username, password))
-    with driver.session() as session:
-        result = session.run(cypher_query)
-        return [record.data() for record in result]
+def execute_cypher(cypher_query, uri, username, password, params=None, db=None):
+    rows, _, _, _ = run_read_query(cypher_query, uri, username, password, params=params, db=db)
+    return rows
 
 
 # Function to generate detailed response using LLM
-def generate_detailed_response(kg_results, max_tokens=550):
-    response_prompt = f"""
+class PipelineCancelled(Exception):
+    """Raised inside a running pipeline once its job has been cancelled (e.g. the user re-submitted)."""
+
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise PipelineCancelled()
+
+
+# ---- explanation payload compaction ----
+EXPLAIN_TOKEN_BUDGET = int(os.getenv("CGEX_EXPLAIN_TOKEN_BUDGET", "3000"))
+EXPLAIN_EVIDENCE_CHARS = int(os.getenv("CGEX_EXPLAIN_EVIDENCE_CHARS", "160"))
+EXPLAIN_REL_PROPS = ("pmid", "evidence", "source")   # relationship properties worth explaining
+
+_TOKEN_ENCODER = None
+
+
+def count_tokens(text):
+    """Token count with tiktoken (o200k_base); falls back to ~4 chars/token if unavailable."""
+    global _TOKEN_ENCODER
+    if _TOKEN_ENCODER is None:
+        try:
+            import tiktoken
+            _TOKEN_ENCODER = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"⚠️ tiktoken unavailable ({e}); estimating tokens from length")
+            _TOKEN_ENCODER = False
+    if _TOKEN_ENCODER:
+        return len(_TOKEN_ENCODER.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _node_display_name(props, fallback):
+    return str(props.get("name") or props.get("label") or props.get("id") or fallback)
+
+
+def _short_prop(value, limit):
+    text = value if isinstance(value, str) else safe_json(value, compact=True)
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _row_for_llm(value, name_by_props):
+    """A result row with graph entities (driver objects or their record.data() forms) named, not dumped."""
+    if isinstance(value, Node):
+        return _node_display_name(dict(value), value.element_id)
+    if isinstance(value, Relationship):
+        start = _row_for_llm(value.start_node, name_by_props) if value.start_node is not None else "?"
+        end = _row_for_llm(value.end_node, name_by_props) if value.end_node is not None else "?"
+        return f"{start} -[{value.type}]-> {end}"
+    if isinstance(value, Path):
+        return [_row_for_llm(r, name_by_props) for r in value.relationships] or \
+            [_row_for_llm(n, name_by_props) for n in value.nodes]
+    if isinstance(value, dict):
+        if value:
+            name = name_by_props.get(safe_json(value, compact=True))
+            if name is not None:
+                return name
+        return {k: _row_for_llm(v, name_by_props) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # record.data() renders a relationship as (start props, TYPE, end props)
+        if (len(value) == 3 and isinstance(value[1], str) and isinstance(value[0], dict)
+                and isinstance(value[2], dict)):
+            start, end = _row_for_llm(value[0], name_by_props), _row_for_llm(value[2], name_by_props)
+            if isinstance(start, str) and isinstance(end, str):
+                return f"{start} -[{value[1]}]-> {end}"
+        return [_row_for_llm(v, name_by_props) for v in value]
+    return value
+
+
+def compact_results_for_llm(results, nodes, rels, max_tokens=EXPLAIN_TOKEN_BUDGET):
+    """
+    Compact, deduplicated view of a query result for the explanation prompt: the rows (graph
+    entities replaced by their display names, so counts and other scalar columns survive),
+    entities once (name + labels) and relationships as a triple list with only the essential
+    properties, all under a tiktoken-measured budget. When the result has graph entities the
+    rows get at most half of the budget. Returns (payload_text, stats).
+    """
+    stats = {"rows": len(results or []), "nodes": len(nodes or []), "rels": len(rels or []),
+             "budget": max_tokens, "truncated": False, "nodes_kept": 0, "rels_kept": 0, "rows_kept": 0}
+
+    # deduplicated rows as compact JSON lines
+    name_by_props = {safe_json(n.get("properties") or {}, compact=True):
+                     _node_display_name(n.get("properties") or {}, n["id"])
+                     for n in nodes or [] if n.get("properties")}
+    row_budget = max_tokens // 2 if (nodes or rels) else max_tokens
+    row_lines, seen_rows, used = [], set(), 0
+    for row in results or []:
+        line = safe_json(_row_for_llm(row, name_by_props), compact=True)
+        if line in seen_rows:
+            continue
+        cost = count_tokens(line)
+        if used + cost > row_budget:
+            stats["truncated"] = True
+            break
+        used += cost
+        seen_rows.add(line)
+        row_lines.append(line)
+    stats["rows_kept"] = len(row_lines)
+
+    entity_lines, rel_lines, parts = [], [], []
+    if nodes or rels:
+        name_by_id, entity_line_by_id = {}, {}
+        for n in nodes:
+            props = n.get("properties") or {}
+            name = _node_display_name(props, n["id"])
+            name_by_id[n["id"]] = name
+            labels = ", ".join(n.get("labels") or [])
+            entity_line_by_id[n["id"]] = f"- {name}" + (f" [{labels}]" if labels else "")
+
+        seen_lines = set()
+
+        def _entity_cost(nid):
+            line = entity_line_by_id.get(nid)
+            return 0 if line is None or line in seen_lines else count_tokens(line)
+
+        def _emit_entity(nid):
+            nonlocal used
+            line = entity_line_by_id.get(nid)
+            if line is None or line in seen_lines:
+                return True
+            cost = count_tokens(line)
+            if used + cost > max_tokens:
+                return False
+            used += cost
+            seen_lines.add(line)
+            entity_lines.append(line)
+            return True
+
+        rels_cut = False
+        for r in rels:
+            props = r.get("properties") or {}
+            kept = [f"{k}: {_short_prop(props[k], EXPLAIN_EVIDENCE_CHARS)}" for k in EXPLAIN_REL_PROPS if props.get(k)]
+            start = name_by_id.get(r.get("startNode"), r.get("startNode"))
+            end = name_by_id.get(r.get("endNode"), r.get("endNode"))
+            line = f"- {start} -[{r.get('type', 'REL')}" + (" {" + "; ".join(kept) + "}" if kept else "") + f"]-> {end}"
+            if line in seen_lines:
+                continue  # parallel duplicates across rows/paths
+            endpoints = list(dict.fromkeys([r.get("startNode"), r.get("endNode")]))
+            cost = count_tokens(line) + sum(_entity_cost(nid) for nid in endpoints)
+            if used + cost > max_tokens:
+                stats["truncated"] = rels_cut = True
+                break
+            for nid in endpoints:
+                _emit_entity(nid)
+            used += count_tokens(line)
+            seen_lines.add(line)
+            rel_lines.append(line)
+
+        if not rels_cut:
+            for n in nodes:
+                if not _emit_entity(n["id"]):
+                    stats["truncated"] = True
+                    break
+        stats["nodes_kept"], stats["rels_kept"] = len(entity_lines), len(rel_lines)
+
+        parts = ["Entities (name [labels]):"] + entity_lines
+        if rel_lines:
+            parts += ["", "Relationships (stored direction: start -[TYPE {evidence}]-> end):"] + rel_lines
+        parts.append("")
+    parts += ["Rows:"] + row_lines
+
+    if stats["truncated"]:
+        parts.append(f"... (truncated to fit {max_tokens} tokens: {stats['nodes_kept']}/{stats['nodes']} entities, "
+                     f"{stats['rels_kept']}/{stats['rels']} relationships, {stats['rows_kept']}/{stats['rows']} rows shown)")
+    payload = "\n".join(parts)
+    stats["tokens"] = count_tokens(payload)
+    print(f"[compact] {stats}")
+    return payload, stats
+
+
+def _detailed_response_prompt(kg_results):
+    # kg_results: a compacted payload (str) or raw results (dumped as JSON like before)
+    payload = kg_results if isinstance(kg_results, str) else safe_json(kg_results)
+    return f"""
     You are a medical expert in COVID-19 and NDD (Neurodegenerative Diseases) knowledge.
     Make sure you give complete response. It can be concise but should not be incomplete.
     Ensure that your response ends with a complete thought and does not stop abruptly.
@@ -620,16 +1467,43 @@ def generate_detailed_response(kg_results, max_tokens=550):
     
     Based on the following knowledge graph results, provide a detailed and structured response:
 
-    {json.dumps(kg_results, indent=2)}
+    {payload}
  
     Detailed Response:
     """
-    return llm.invoke(response_prompt).content
+
+
+def generate_detailed_response(kg_results, max_tokens=550):
+    response_prompt = _detailed_response_prompt(kg_results)
+    t0 = time.perf_counter()
+    msg = get_llm().invoke(response_prompt)
+    record_llm_usage(msg, "explanation", time.perf_counter() - t0)
+    return msg.content
+
+
+def stream_detailed_response(kg_results, on_token=None, max_tokens=550, cancel_event=None):
+    """Like generate_detailed_response, but streams: on_token(text_so_far) is called as chunks arrive."""
+    response_prompt = _detailed_response_prompt(kg_results)
+    t0 = time.perf_counter()
+    text, final = "", None
+    for chunk in get_llm().stream(response_prompt):
+        check_cancelled(cancel_event)  # stops the stream (and the HTTP response) early
+        final = chunk if final is None else final + chunk
+        if isinstance(chunk.content, str) and chunk.content:
+            text += chunk.content
+            if on_token:
+                on_token(text)
+    if final is not None:
+        record_llm_usage(final, "explanation", time.perf_counter() - t0)
+    return text
 
 
 # CSS for background image and styling
 external_stylesheets = [dbc.themes.BOOTSTRAP]
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+# Dash serializes callback outputs (Cytoscape elements, results text) through plotly's JSON encoder
+if orjson is not None:
+    pio.json.config.default_engine = "orjson"
 
 
 # Add this 👇
@@ -943,37 +1817,287 @@ dbc.Row([
         dbc.Col(html.H3("Explainability"), width=12),
         dbc.Col(html.H5("Prompt sent to the LLM:"), width=12),
         dbc.Col(html.Pre(id='cypher-prompt', style={'whiteSpace': 'pre-wrap', 'margin-top': '10px', 'text-align': 'left'}), width=12)
-    ], className="mb-4")
+    ], className="mb-4"),
+
+    # background pipeline job: id + last delivered versions, polled while running
+    dcc.Store(id='pipeline-job'),       # {"id"} of this browser's current job; written by update_output only
+    dcc.Store(id='pipeline-job-seen'),  # {"id", "seen", "done"}: what poll_pipeline_job already pushed
+    dcc.Interval(id='job-poll', interval=400, disabled=True)
 ], className="container")
+_startup_mark("layout")
 
 
 
 # ---- helpers (place these well above the callback) ----
-def format_prompt_with_examples(prompt_template, question, examples=None):
-    base = prompt_template.format(question=question)
-    if not examples:
-        final = base
-    else:
-        shots = []
-        for ex in examples:
-            q = ex.get("example question") or ex.get("question")
-            c = ex.get("example cypher") or ex.get("cypher")
-            if q and c:
-                shots.append(f"Example Question: {q}\nExample Cypher:\n```cypher\n{c}\n```")
-        final = ("\n\n".join(shots) + "\n\n" + base) if shots else base
+
+# Prompt layout sent to the LLM:
+#   "legacy" – few-shot examples first, then the template with the question embedded in it
+#   "prefix" – instructions + schema first (stable, cacheable prefix), then examples, question last
+#   "system" – like "prefix", but the stable part goes in a separate system message
+PROMPT_LAYOUT = os.getenv("CGEX_PROMPT_LAYOUT", "prefix")
+
+STRICT_ENDING = "Return only the Cypher query enclosed in a ```cypher``` code block. Do not add any explanation."
+
+
+def _format_shots(examples):
+    shots = []
+    for ex in examples or []:
+        q = ex.get("example question") or ex.get("question")
+        c = ex.get("example cypher") or ex.get("cypher")
+        if q and c:
+            shots.append(f"Example Question: {q}\nExample Cypher:\n```cypher\n{c}\n```")
+    return shots
+
+
+def prompt_parts(prompt_template, question, examples=None, hints=None):
+    """
+    Split the prompt into (stable prefix, per-request tail) for the prefix layouts.
+    The prefix is the template's instructions + schema and is byte-identical across
+    requests on the same schema; examples, grounding hints and the question follow it.
+    """
+    text = getattr(prompt_template, "template", None) or str(prompt_template)
+    head = text.partition("{question}")[0]
+    static, lead, _ = head.rpartition(QUESTION_LEAD)
+    if not lead:  # template without the usual lead line
+        static, lead = head, ""
+    shots = _format_shots(examples)
+    extra = [hints] if hints else []
+    tail = "\n\n".join(shots + extra + [f"{lead}\n{question}".strip()]) + "\n\n" + STRICT_ENDING
+    return static.rstrip() + "\n", tail
+
+
+def format_prompt_with_examples(prompt_template, question, examples=None, layout=None, hints=None):
+    layout = layout or PROMPT_LAYOUT
+    if layout != "legacy":
+        static, tail = prompt_parts(prompt_template, question, examples, hints)
+        return static + "\n" + tail
+
+    base = splice_question(prompt_template, question)
+    shots = _format_shots(examples) + ([hints] if hints else [])
+    final = ("\n\n".join(shots) + "\n\n" + base) if shots else base
 
     # 👇 add this strict ending
-    final += "\n\nReturn only the Cypher query enclosed in a ```cypher``` code block. Do not add any explanation."
+    final += "\n\n" + STRICT_ENDING
     return final
 
+
+def build_llm_input(prompt_template, question, examples=None, layout=None, hints=None):
+    """Return (what to send to llm.invoke, prompt text shown in the Explainability panel)."""
+    layout = layout or PROMPT_LAYOUT
+    if layout == "system":
+        static, tail = prompt_parts(prompt_template, question, examples, hints)
+        return [("system", static), ("human", tail)], static + "\n" + tail
+    prompt_text = format_prompt_with_examples(prompt_template, question, examples, layout=layout, hints=hints)
+    return prompt_text, prompt_text
+
+
+# ---- LLM usage instrumentation ----
+_LLM_USAGE = {}   # stage -> running totals
+_LLM_USAGE_LOCK = threading.Lock()
+
+
+def record_llm_usage(msg, stage, elapsed_s=None):
+    """Log token usage of one LLM call, incl. prompt tokens served from the provider's prefix cache."""
+    usage = getattr(msg, "usage_metadata", None) or {}
+    token_usage = (getattr(msg, "response_metadata", None) or {}).get("token_usage") or {}
+    input_tokens = usage.get("input_tokens") or token_usage.get("prompt_tokens") or 0
+    output_tokens = usage.get("output_tokens") or token_usage.get("completion_tokens") or 0
+    cached = (usage.get("input_token_details") or {}).get("cache_read") \
+        or (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+    with _LLM_USAGE_LOCK:
+        tot = _LLM_USAGE.setdefault(stage, {"calls": 0, "input_tokens": 0, "cached_tokens": 0,
+                                            "output_tokens": 0, "latency_s": 0.0})
+        tot["calls"] += 1
+        tot["input_tokens"] += input_tokens
+        tot["cached_tokens"] += cached
+        tot["output_tokens"] += output_tokens
+        tot["latency_s"] += elapsed_s or 0.0
+
+    pct = (100.0 * cached / input_tokens) if input_tokens else 0.0
+    took = f" in {elapsed_s:.2f}s" if elapsed_s is not None else ""
+    print(f"[llm:{stage}] input={input_tokens} cached={cached} ({pct:.0f}%) output={output_tokens}{took}")
+
+
+def llm_usage_metrics():
+    with _LLM_USAGE_LOCK:
+        out = {}
+        for stage, tot in _LLM_USAGE.items():
+            out[stage] = dict(tot)
+            out[stage]["cached_ratio"] = round(tot["cached_tokens"] / tot["input_tokens"], 3) if tot["input_tokens"] else 0.0
+            out[stage]["avg_latency_s"] = round(tot["latency_s"] / tot["calls"], 3) if tot["calls"] else 0.0
+        return out
+
 CY_CODE_BLOCK = re.compile(r"```cypher\s*(.*?)```", re.DOTALL | re.IGNORECASE)
 CY_FALLBACK   = re.compile(r"(MATCH[\s\S]*?RETURN[\s\S]*?)(?:$|\n\n|```)", re.IGNORECASE)
 
+
+# ---- Cypher guard: runs between extraction and execution ----
+# Generated queries are read-only, get a LIMIT (capped at CYPHER_MAX_LIMIT), have every
+# variable-length pattern bounded to CYPHER_MAX_HOPS, and are EXPLAINed first so plans whose
+# expand/join operators estimate more than CYPHER_MAX_EST_ROWS rows are rejected before they
+# hit the KG (leaf scans are not counted).
+CYPHER_MAX_LIMIT = int(os.getenv("CGEX_CYPHER_MAX_LIMIT", "1000"))
+CYPHER_MAX_HOPS = int(os.getenv("CGEX_CYPHER_MAX_HOPS", "3"))
+CYPHER_MAX_EST_ROWS = float(os.getenv("CGEX_CYPHER_MAX_EST_ROWS", "1000000"))
+# plan operators whose row estimate the threshold applies to
+_PLAN_GROWTH_OPERATOR = re.compile(r"Expand|Join|CartesianProduct|TriadicSelection|ShortestPath", re.IGNORECASE)
+
+_CY_WRITE_CLAUSE = re.compile(
+    r"(?<![.:\w$])(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV|IN\s+TRANSACTIONS|"
+    r"ALTER|GRANT|DENY|REVOKE)\b|\bCALL\s+(apoc\.(create|merge|refactor|periodic)|dbms\.|db\.create)",
+    re.IGNORECASE)
+_CY_VAR_LENGTH = re.compile(r"(-\s*\[[^\[\]]*?)\*\s*(\d*)\s*(\.\.(?:\s*(\d+))?)?(\s*(\{[^{}]*\})?\s*\])")
+_CY_LIMIT = re.compile(r"\bLIMIT\s+(\S+)", re.IGNORECASE)
+
+
+class CypherGuardError(ValueError):
+    """Raised when a generated query is rejected by guard_cypher()."""
+
+
+def _mask_cypher_literals(cypher):
+    """Same-length copy of the query with string literals / quoted names blanked out (keyword scans ignore them)."""
+    out, quote, i = [], None, 0
+    while i < len(cypher):
+        ch = cypher[i]
+        if quote:
+            if ch == "\\" and quote != "`":
+                out.append("__")
+                i += 2
+                continue
+            out.append(ch if ch == quote else "_")
+            if ch == quote:
+                quote = None
+        else:
+            if ch in "'\"`":
+                quote = ch
+            out.append(ch)
+        i += 1
+    return "".join(out)[:len(cypher)]
+
+
+def _top_level_spans(masked, pattern):
+    """Match objects of `pattern` in `masked` that are outside any (), [] or {} nesting."""
+    depth_at, depth = [], 0
+    for ch in masked:
+        if ch in "([{":
+            depth += 1
+        depth_at.append(depth)
+        if ch in ")]}":
+            depth -= 1
+    return [m for m in pattern.finditer(masked) if depth_at[m.start()] == 0]
+
+
+def _apply_edits(text, edits):
+    """Apply (start, end, replacement) edits (non-overlapping) from the end backwards."""
+    for start, end, repl in sorted(edits, reverse=True):
+        text = text[:start] + repl + text[end:]
+    return text
+
+
+def _cap_limits(cypher, report):
+    """Inject or cap the LIMIT of the final RETURN in every top-level UNION branch."""
+    masked = _mask_cypher_literals(cypher)
+    branch_ends = [m.start() for m in _top_level_spans(masked, re.compile(r"\bUNION\b", re.IGNORECASE))]
+    edits, start = [], 0
+    for end in branch_ends + [len(cypher)]:
+        part = masked[start:end]
+        returns = _top_level_spans(part, re.compile(r"\bRETURN\b", re.IGNORECASE))
+        if returns:
+            tail_at = returns[-1].end()
+            limits = _top_level_spans(part[tail_at:], _CY_LIMIT)
+            if not limits:
+                insert_at = start + len(part.rstrip())
+                edits.append((insert_at, insert_at, f" LIMIT {CYPHER_MAX_LIMIT}"))
+                report["limit_injected"] = True
+            else:
+                m = limits[-1]
+                value = m.group(1)
+                if value.isdigit() and int(value) > CYPHER_MAX_LIMIT:
+                    at = start + tail_at + m.start(1)
+                    edits.append((at, at + len(value), str(CYPHER_MAX_LIMIT)))
+                    report["limit_capped_from"] = int(value)
+        start = end
+    return _apply_edits(cypher, edits)
+
+
+def _bound_var_length(cypher, report):
+    """Rewrite [*], [*n..], [*..m] patterns so the upper bound is at most CYPHER_MAX_HOPS."""
+    masked = _mask_cypher_literals(cypher)
+    edits = []
+    for m in _CY_VAR_LENGTH.finditer(masked):
+        lo_txt, has_range, hi_txt = m.group(2), m.group(3), m.group(4)
+        lo = int(lo_txt) if lo_txt else 1
+        if not has_range and lo_txt:
+            hi = lo                       # exact length, e.g. [*2]
+        else:
+            hi = int(hi_txt) if hi_txt else None
+        if lo > CYPHER_MAX_HOPS:
+            raise CypherGuardError(f"variable-length pattern needs at least {lo} hops (max {CYPHER_MAX_HOPS})")
+        if hi is not None and hi <= CYPHER_MAX_HOPS:
+            continue
+        bounded = f"*{lo_txt}..{CYPHER_MAX_HOPS}"
+        edits.append((m.end(1), m.end(3) if has_range else m.end(2), bounded))
+        report.setdefault("hops_bounded", []).append(masked[m.start():m.end()])
+    return _apply_edits(cypher, edits)
+
+
+def _plan_estimated_rows(plan):
+    """
+    Largest EstimatedRows over the expand / join / product operators of an EXPLAIN plan (dict
+    tree from the driver): the row blow-up of traversals and joins. Leaf scans are left out, as
+    an AllNodesScan under a CONTAINS filter always estimates the whole KG. 0 if none.
+    """
+    best, stack = 0.0, [plan]
+    while stack:
+        p = stack.pop()
+        operator = str(p.get("operatorType") or p.get("operator_type") or "").split("@")[0]
+        if _PLAN_GROWTH_OPERATOR.search(operator):
+            args = p.get("args") or p.get("arguments") or {}
+            best = max(best, float(args.get("EstimatedRows") or 0))
+        stack.extend(p.get("children") or [])
+    return best
+
+
+def guard_cypher(cypher, uri=None, username=None, password=None, params=None, db=None, explain=True):
+    """
+    Make a generated query safe to run: reject write clauses, bound variable-length patterns,
+    inject/cap LIMIT and (when connection details are given) EXPLAIN it and reject plans whose
+    estimated rows exceed CYPHER_MAX_EST_ROWS. Returns (guarded_cypher, report);
+    raises CypherGuardError on rejection.
+    """
+    report = {}
+    cypher = (cypher or "").strip().rstrip(";").strip()
+    if not cypher:
+        raise CypherGuardError("empty query")
+    write = _CY_WRITE_CLAUSE.search(_mask_cypher_literals(cypher))
+    if write:
+        raise CypherGuardError(f"write/admin clause '{write.group(0).strip()}' is not allowed")
+
+    guarded = _cap_limits(_bound_var_length(cypher, report), report)
+
+    if explain and uri:
+        session_kwargs = {"database": db} if db else {}
+        with kg_session(uri, username, password, **session_kwargs) as session:
+            summary = session.run("EXPLAIN " + guarded, params or {}).consume()
+        if summary.plan:
+            estimated = _plan_estimated_rows(summary.plan)
+            report["estimated_rows"] = round(estimated)
+            if estimated > CYPHER_MAX_EST_ROWS:
+                raise CypherGuardError(f"plan estimates ~{estimated:,.0f} rows "
+                                       f"(limit {CYPHER_MAX_EST_ROWS:,.0f}); narrow the question")
+    if guarded != cypher:
+        print(f"[cypher-guard] rewrote query: {report}")
+    return guarded, report
+
 def fetch_graph_via_http(cypher_query, http_base_url, username, password, db="neo4j"):
     """
     Use Neo4j transactional HTTP endpoint to get the result as a graph
     (nodes + relationships), similar to Neo4j Browser's 'Graph' tab.
     """
+    import requests
+    from requests.auth import HTTPBasicAuth
+
     url = f"{http_base_url}/db/{db}/tx/commit"
     payload = {
         "statements": [
@@ -1011,41 +2135,192 @@ def fetch_graph_via_bolt(cypher_query, uri, username, password, db="neo4j"):
     (nodes + relationships), similar to Neo4j Browser's 'Graph' view.
     Works with Aura (no HTTP needed).
     """
+    with kg_session(uri, username, password, database=db) as session:
+        graph_obj = session.run(cypher_query).graph()
+        # graph_obj has .nodes and .relationships
+        return _graph_to_dicts(graph_obj)
+
+
+def execute_cypher_graph(cypher_query, uri, username, password, params=None, db=None, cancel_event=None,
+                         on_row=None, stats=None):
+    """
+    Run the Cypher ONCE and derive both views from the same Bolt result:
+    the tabular rows (record.data()) and the Browser-style graph (nodes, rels).
+    Rows are consumed from stream_cypher() in one pass: each is handed to `on_row` as it
+    arrives (e.g. incremental JSON rendering) while its graph entities are collected.
+    """
+    node_objs, rel_objs = {}, {}
+    records = []
+    for row in stream_cypher(cypher_query, uri, username, password, params=params, db=db,
+                             cancel_event=cancel_event, graph=(node_objs, rel_objs), stats=stats):
+        records.append(row)
+        if on_row is not None:
+            on_row(row)
+    # every Node/Relationship met in the (capped) rows, incl. relationship endpoints
+    nodes, rels = _graph_to_dicts(SimpleNamespace(nodes=list(node_objs.values()),
+                                                  relationships=list(rel_objs.values())))
+    return records, nodes, rels
+
+
+def _graph_to_dicts(graph_obj):
+    """neo4j Graph -> (nodes, rels) as plain dicts (same shape as the HTTP 'graph' format)."""
     nodes = []
     rels = []
 
-    with GraphDatabase.driver(uri, auth=(username, password)) as driver:
-        graph_obj = driver.execute_query(
-            cypher_query,
-            database_=db,
-            result_transformer_=neo4j_mod.Result.graph,
-        )
-        # graph_obj has .nodes and .relationships
+    for n in graph_obj.nodes:
+        nid = getattr(n, "element_id", getattr(n, "id", None))
+        labels = list(getattr(n, "labels", []))
+        props = dict(n)
+        nodes.append({
+            "id": str(nid),
+            "labels": labels,
+            "properties": props,
+        })
 
-        for n in graph_obj.nodes:
-            nid = getattr(n, "element_id", getattr(n, "id", None))
-            labels = list(getattr(n, "labels", []))
-            props = dict(n)
-            nodes.append({
-                "id": str(nid),
-                "labels": labels,
-                "properties": props,
-            })
-
-        for r in graph_obj.relationships:
-            rid = getattr(r, "element_id", getattr(r, "id", None))
-            start = getattr(r.start_node, "element_id", getattr(r.start_node, "id", None))
-            end = getattr(r.end_node, "element_id", getattr(r.end_node, "id", None))
-            rels.append({
-                "id": str(rid),
-                "type": r.type,
-                "startNode": str(start),
-                "endNode": str(end),
-                "properties": dict(r),
-            })
+    for r in graph_obj.relationships:
+        rid = getattr(r, "element_id", getattr(r, "id", None))
+        start = getattr(r.start_node, "element_id", getattr(r.start_node, "id", None))
+        end = getattr(r.end_node, "element_id", getattr(r.end_node, "id", None))
+        rels.append({
+            "id": str(rid),
+            "type": r.type,
+            "startNode": str(start),
+            "endNode": str(end),
+            "properties": dict(r),
+        })
 
     return nodes, rels
 
+
+# ---- executed-query result cache ----
+def normalize_cypher(cypher):
+    """Whitespace-insensitive form of a Cypher query (literals are left untouched)."""
+    cypher = cypher or ""
+    parts, pos = [], 0
+    # whitespace runs are found on the masked copy, so spaces inside string literals survive
+    for m in re.finditer(r"\s+", _mask_cypher_literals(cypher)):
+        parts.append(cypher[pos:m.start()])
+        parts.append(" ")
+        pos = m.end()
+    parts.append(cypher[pos:])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _approx_size(obj, _depth=0):
+    """Rough in-memory footprint in bytes of plain result data (dicts/lists/scalars)."""
+    if _depth > 50:
+        return 64
+    if isinstance(obj, (str, bytes)):
+        return 49 + len(obj)
+    if isinstance(obj, dict):
+        return 64 + sum(_approx_size(k, _depth + 1) + _approx_size(v, _depth + 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return 56 + sum(_approx_size(x, _depth + 1) for x in obj)
+    return 28
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of executed Cypher results keyed by (KG, normalized Cypher, parameters,
+    database). Each entry holds the tabular records and the graph projection (nodes, rels).
+    Bounded by entry count and approximate memory, expires after `ttl_s`, and drops a KG's
+    entries as soon as its schema fingerprint changes.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl_s=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(kg_id, cypher, params=None, db=None):
+        return (kg_id, normalize_cypher(cypher), json.dumps(params or {}, sort_keys=True, default=str), db)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry["size"]
+
+    def contains(self, key, schema_version=None):
+        """True if a live entry exists (no LRU or hit/miss bookkeeping)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and time.time() - entry["stored_at"] <= self.ttl_s and not (
+                schema_version and entry["schema_version"] != schema_version)
+
+    def get(self, key, schema_version=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (time.time() - entry["stored_at"] > self.ttl_s
+                                      or (schema_version and entry["schema_version"] != schema_version)):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, key, records, nodes, rels, schema_version=None, truncated=False):
+        size = _approx_size(records) + _approx_size(nodes) + _approx_size(rels)
+        if size > self.max_bytes:
+            return  # a single oversized result is not worth evicting everything for
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = {"records": records, "nodes": nodes, "rels": rels, "size": size,
+                                 "truncated": truncated, "schema_version": schema_version,
+                                 "stored_at": time.time()}
+            self.total_bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                self._drop(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate_kg(self, kg_id):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == kg_id]:
+                self._drop(key)
+                self.stats["invalidations"] += 1
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes)
+
+
+RESULT_CACHE = ResultCache(
+    max_entries=int(os.getenv("CGEX_RESULT_CACHE_SIZE", "256")),
+    max_bytes=int(os.getenv("CGEX_RESULT_CACHE_MB", "64")) * 1024 * 1024,
+    ttl_s=float(os.getenv("CGEX_RESULT_CACHE_TTL_S", "600")),
+)
+
+
+def run_cypher_cached(cypher, uri, username, password, db="neo4j", params=None, schema_version=None,
+                      cancel_event=None, on_row=None, stats=None):
+    """
+    (records, nodes, rels) for a Cypher query, served from RESULT_CACHE when possible.
+    `on_row` sees every row either way; stats["truncated"] tells whether a cap was hit.
+    """
+    stats = {} if stats is None else stats
+    key = ResultCache.key(kg_id_for_uri(uri), cypher, params, db)
+    hit = RESULT_CACHE.get(key, schema_version)
+    if hit is not None:
+        print("[result-cache] hit")
+        stats.update(rows=len(hit["records"]), truncated=hit.get("truncated", False), cached=True)
+        if on_row is not None:
+            for row in hit["records"]:
+                on_row(row)
+        return list(hit["records"]), list(hit["nodes"]), list(hit["rels"])
+
+    records, nodes, rels = execute_cypher_graph(cypher, uri, username, password, params=params, db=db,
+                                                cancel_event=cancel_event, on_row=on_row, stats=stats)
+    RESULT_CACHE.put(key, records, nodes, rels, schema_version, truncated=stats.get("truncated", False))
+    return list(records), list(nodes), list(rels)
+
+
 def graph_to_cytoscape(nodes, rels):
     """
     Convert HTTP 'graph' result (dicts with id/labels/properties/startNode/endNode)
@@ -1104,10 +2379,871 @@ def graph_to_cytoscape(nodes, rels):
 
     return elements
 
-def run_pipeline_direct(question, graph, uri, http_url, username, password, prompt_template, use_few_shot=False):
-    examples = load_examples(EXAMPLES_FILE_PATH) if use_few_shot else None
-    prompt_text = format_prompt_with_examples(prompt_template, question, examples)
-    msg = llm.invoke(prompt_text)
+# ---- question → Cypher cache ----
+_QUESTION_STOPWORDS = frozenset("""
+a an the of in on for to and or with by from as at about into onto what which who whom whose how
+are is was were be been being do does did that this these those any all there their its it
+""".split())
+
+
+def normalize_question(question):
+    """Lowercase, strip punctuation, collapse whitespace."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (question or "").lower()).split())
+
+
+# words that change what a question asks for; the question cache never drops or ignores them
+_QUESTION_OPERATORS = frozenset("and or nor not no without except neither never".split())
+
+
+def question_terms(question, keep_operators=False):
+    """Content words of a question, lightly stemmed (plural 's' dropped), in question order."""
+    terms = []
+    for t in normalize_question(question).split():
+        if t in _QUESTION_STOPWORDS and not (keep_operators and t in _QUESTION_OPERATORS):
+            continue
+        if len(t) > 3 and t.endswith("s") and not t.endswith("ss"):
+            t = t[:-1]
+        terms.append(t)
+    return terms
+
+
+def _trigram_vector(terms):
+    vec = Counter()
+    for t in terms:
+        padded = f"#{t}#"
+        for i in range(len(padded) - 2):
+            vec[padded[i:i + 3]] += 1
+    return vec
+
+
+def _cosine(a, b, norm_a, norm_b):
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0) for k, v in a.items()) / (norm_a * norm_b)
+
+
+def canonical_question(question):
+    """
+    One wording for known reorderings, so they share a cache key: "COVID-associated genes" and
+    "genes associated with COVID" both become "genes associated with covid" (the fast-path
+    shapes). Every word, including negations and conjunctions, is kept.
+    """
+    text = " ".join((question or "").lower().replace("?", " ").replace("’", "'").split()).rstrip(".!")
+    for _, pattern in _FASTPATH_SHAPES:
+        m = pattern.match(text)
+        if m:
+            return f"{m.group('x')} {m.group('link')} with {m.group('y')}"
+    return question
+
+
+def _typo_variants(a, b):
+    """True if two differing terms look like spellings of the same word (same digits, long, close)."""
+    return (min(len(a), len(b)) >= 5 and re.sub(r"\D", "", a) == re.sub(r"\D", "", b)
+            and difflib.SequenceMatcher(None, a, b).ratio() >= 0.85)
+
+
+def _same_question_shape(terms_a, terms_b, max_typos=2):
+    """
+    Same terms in the same order except for up to `max_typos` misspelled content words; any
+    difference in negation/conjunction words, in word order or in the entities mentioned fails.
+    """
+    if len(terms_a) != len(terms_b):
+        return False
+    typos = 0
+    for a, b in zip(terms_a, terms_b):
+        if a == b:
+            continue
+        if a in _QUESTION_OPERATORS or b in _QUESTION_OPERATORS or not _typo_variants(a, b):
+            return False
+        typos += 1
+    return typos <= max_typos
+
+
+class QuestionCypherCache:
+    """
+    LRU cache of question → Cypher translations, scoped per (KG, schema fingerprint).
+    Lookup is an exact match on the normalized content words in question order (negation and
+    conjunction words kept) first; otherwise the nearest cached question by character-trigram
+    cosine similarity above `threshold`, and only if it differs by misspellings alone.
+    Entries persist to a JSON file so they survive restarts.
+    """
+
+    def __init__(self, path, max_entries=2000, threshold=0.92, save_every=20):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.save_every = save_every
+        self.entries = OrderedDict()   # (kg_id, schema_version, key) -> entry
+        self.lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+        self._unsaved = 0
+
+    @staticmethod
+    def _terms(question):
+        return question_terms(canonical_question(question), keep_operators=True)
+
+    @classmethod
+    def _key(cls, question):
+        return " ".join(cls._terms(question))
+
+    def _entry(self, kg_id, schema_version, question, cypher, source):
+        terms = self._terms(question)
+        vec = _trigram_vector(terms)
+        return {"kg_id": kg_id, "schema_version": schema_version, "question": question,
+                "cypher": cypher, "source": source, "terms": terms, "vec": vec,
+                "norm": sum(v * v for v in vec.values()) ** 0.5}
+
+    def get(self, kg_id, schema_version, question):
+        """Return {"cypher", "question", "similarity", "match"} or None."""
+        key = (kg_id, schema_version, self._key(question))
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit is not None:
+                self.entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return {"cypher": hit["cypher"], "question": hit["question"], "similarity": 1.0, "match": "exact"}
+
+            terms = self._terms(question)
+            vec = _trigram_vector(terms)
+            norm = sum(v * v for v in vec.values()) ** 0.5
+            best_key, best_sim = None, 0.0
+            for k, e in self.entries.items():
+                if k[0] != kg_id or k[1] != schema_version:
+                    continue
+                sim = _cosine(vec, e["vec"], norm, e["norm"])
+                if sim > best_sim and _same_question_shape(terms, e["terms"]):
+                    best_key, best_sim = k, sim
+            if best_key is not None and best_sim >= self.threshold:
+                self.entries.move_to_end(best_key)
+                self.stats["similar_hits"] += 1
+                e = self.entries[best_key]
+                return {"cypher": e["cypher"], "question": e["question"], "similarity": round(best_sim, 3), "match": "similar"}
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, kg_id, schema_version, question, cypher, source="generated"):
+        if not (question and cypher):
+            return
+        key = (kg_id, schema_version, self._key(question))
+        with self.lock:
+            prev = self.entries.get(key)
+            if prev is not None and prev["source"] == "approved" and source != "approved":
+                return  # never overwrite a human-approved translation with a generated one
+            self.entries[key] = self._entry(kg_id, schema_version, question, cypher, source)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._unsaved += 1
+            save_now = source == "approved" or self._unsaved >= self.save_every
+        if save_now:
+            self.save()
+
+    def discard(self, kg_id, schema_version, question):
+        with self.lock:
+            self.entries.pop((kg_id, schema_version, self._key(question)), None)
+
+    def save(self):
+        with self.lock:
+            rows = [{k: e[k] for k in ("kg_id", "schema_version", "question", "cypher", "source")}
+                    for e in self.entries.values()]
+            self._unsaved = 0
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"entries": rows}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not save question cache: {e}")
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                rows = json.load(f).get("entries", [])
+        except (FileNotFoundError, ValueError):
+            return
+        with self.lock:
+            for r in rows[-self.max_entries:]:
+                key = (r["kg_id"], r["schema_version"], self._key(r["question"]))
+                self.entries[key] = self._entry(r["kg_id"], r["schema_version"], r["question"], r["cypher"], r.get("source", "generated"))
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
+
+
+QUESTION_CACHE = QuestionCypherCache(
+    os.getenv("CGEX_QCACHE_PATH", "cypher_cache.json"),
+    max_entries=int(os.getenv("CGEX_QCACHE_SIZE", "2000")),
+    threshold=float(os.getenv("CGEX_QCACHE_THRESHOLD", "0.92")),
+)
+QUESTION_CACHE.load()
+atexit.register(QUESTION_CACHE.save)
+
+
+# ---- relevance-ranked few-shot selection ----
+# Disapprove regenerates with examples, but only the FEWSHOT_K approved examples most similar to
+# the question (TF-IDF over question_terms) and only as many as fit FEWSHOT_TOKEN_BUDGET.
+FEWSHOT_K = int(os.getenv("CGEX_FEWSHOT_K", "4"))
+FEWSHOT_TOKEN_BUDGET = int(os.getenv("CGEX_FEWSHOT_TOKEN_BUDGET", "1200"))
+FEWSHOT_MIN_SCORE = float(os.getenv("CGEX_FEWSHOT_MIN_SCORE", "0.05"))
+
+
+class ExampleIndex:
+    """TF-IDF vectors of the example questions, built once per example set."""
+
+    def __init__(self, examples):
+        self.examples = list(examples)
+        docs = [question_terms(ex.get("example question") or ex.get("question") or "") for ex in self.examples]
+        df = Counter(t for terms in docs for t in set(terms))
+        n = len(docs)
+        self.idf = {t: math.log((1 + n) / (1 + d)) + 1.0 for t, d in df.items()}
+        self.default_idf = math.log(1 + n) + 1.0   # unseen terms weigh like a df=0 term
+        self.vectors = [self._vector(terms) for terms in docs]
+        self.shot_tokens = [count_tokens(shot[0]) if shot else 0
+                            for shot in (_format_shots([ex]) for ex in self.examples)]
+
+    def _vector(self, terms):
+        tf = Counter(terms)
+        vec = {t: c * self.idf.get(t, self.default_idf) for t, c in tf.items()}
+        return vec, math.sqrt(sum(v * v for v in vec.values()))
+
+    def rank(self, question):
+        """[(score, position)] best first."""
+        q_vec, q_norm = self._vector(question_terms(question))
+        scored = [(_cosine(q_vec, vec, q_norm, norm), i) for i, (vec, norm) in enumerate(self.vectors)]
+        return sorted(scored, key=lambda x: (-x[0], x[1]))
+
+
+_EXAMPLE_INDEX = {"signature": None, "index": None}
+_EXAMPLE_INDEX_LOCK = threading.Lock()
+
+
+def _example_index(examples):
+    signature = hashlib.sha1(json.dumps(examples, sort_keys=True).encode("utf-8")).hexdigest()
+    with _EXAMPLE_INDEX_LOCK:
+        if _EXAMPLE_INDEX["signature"] != signature:
+            _EXAMPLE_INDEX.update(signature=signature, index=ExampleIndex(examples))
+        return _EXAMPLE_INDEX["index"]
+
+
+def select_examples(question, examples, k=FEWSHOT_K, max_tokens=FEWSHOT_TOKEN_BUDGET, min_score=FEWSHOT_MIN_SCORE):
+    """
+    Top-k examples most similar to `question` whose formatted shots fit `max_tokens`.
+    Returns (chosen examples, report) where the report lists each chosen example's
+    question, similarity score and token cost.
+    """
+    report = {"candidates": len(examples or []), "chosen": [], "tokens": 0, "budget": max_tokens}
+    if not examples:
+        return [], report
+    index = _example_index(examples)
+    chosen = []
+    for score, i in index.rank(question):
+        if len(chosen) >= k or score < min_score:
+            break
+        cost = index.shot_tokens[i]
+        if report["tokens"] + cost > max_tokens:
+            continue  # a shorter, slightly less similar example may still fit
+        chosen.append(index.examples[i])
+        report["tokens"] += cost
+        report["chosen"].append({"question": index.examples[i].get("example question"),
+                                 "score": round(score, 3), "tokens": cost})
+    print(f"[few-shot] {len(chosen)}/{report['candidates']} examples, {report['tokens']} tokens: "
+          f"{[(c['question'], c['score']) for c in report['chosen']]}")
+    return chosen, report
+
+
+# ---- deterministic template fast-path ----
+# "What X are associated with Y?" / "Y-associated X" questions are answered from a Cypher template
+# instead of a GPT-5 round trip: X is mapped onto a schema label, Y becomes the CONTAINS literal.
+# Anything else, or a low-confidence label match, falls through to the LLM.
+FASTPATH_ENABLED = os.getenv("CGEX_FASTPATH", "1").lower() not in ("0", "false", "no", "off")
+FASTPATH_MIN_CONFIDENCE = float(os.getenv("CGEX_FASTPATH_MIN_CONFIDENCE", "0.85"))
+FASTPATH_HOPS = int(os.getenv("CGEX_FASTPATH_HOPS", "1"))
+FASTPATH_LIMIT = int(os.getenv("CGEX_FASTPATH_LIMIT", "10"))
+
+_FP_LEAD = r"^(?:what|which|list|show(?: me)?|find)\s+(?:are\s+|is\s+)?(?:all\s+)?(?:the\s+)?"
+_FP_LINK = r"(?P<link>associated|linked|related|connected)"
+_FASTPATH_SHAPES = (
+    # what genes are associated with covid-19
+    ("x_associated_with_y", re.compile(_FP_LEAD + r"(?P<x>[a-z][a-z0-9 \-]*?)\s+(?:are\s+|is\s+)?" + _FP_LINK
+                                       + r"\s+(?:with|to)\s+(?P<y>.+)$")),
+    # what are covid-associated genes
+    ("y_associated_x", re.compile(_FP_LEAD + r"(?P<y>[a-z0-9][a-z0-9 ]*?)[- ]" + _FP_LINK
+                                  + r"\s+(?P<x>[a-z][a-z0-9 \-]*)$")),
+)
+_FASTPATH_ALIASES = {"mirna": "microrna", "gene product": "protein", "medication": "drug", "medicine": "drug"}
+_FASTPATH_STATS = {"checked": 0, "hits": 0, "no_shape": 0, "low_confidence": 0, "unknown_entity": 0}
+# prepositions / qualifiers: an entity slot containing one is a phrase ("treatment of covid",
+# "most common covid"), not a node name
+_FASTPATH_QUALIFIERS = frozenset("""
+of in on at by to for from with without after before during via than between among within under over
+most least common commonly top main major frequent frequently known new recent related
+""".split())
+_FASTPATH_STATS_LOCK = threading.Lock()
+_FASTPATH_LABEL_INDEX = {}   # (kg_id, schema fingerprint) -> {squashed label: label}
+_FASTPATH_LABEL_LOCK = threading.Lock()
+
+
+def _fastpath_key(text):
+    """'Protein modifications' / 'ProteinModification' → 'proteinmodification' (plural-insensitive)."""
+    text = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", str(text)).lower()
+    words = []
+    for w in re.findall(r"[a-z0-9]+", text):
+        if len(w) > 3 and w.endswith("ies"):
+            w = w[:-3] + "y"
+        elif len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        words.append(w)
+    key = " ".join(words)
+    return _FASTPATH_ALIASES.get(key, key).replace(" ", "")
+
+
+def _fastpath_labels(entry, kg_id=None):
+    key = (kg_id, entry["fingerprint"])
+    with _FASTPATH_LABEL_LOCK:
+        index = _FASTPATH_LABEL_INDEX.get(key)
+    if index is None:
+        index = {_fastpath_key(label): label for label in schema_labels(entry["schema"])}
+        with _FASTPATH_LABEL_LOCK:
+            # one schema version per KG is plenty: drop this KG's older versions only
+            for stale in [k for k in _FASTPATH_LABEL_INDEX if k[0] == kg_id]:
+                del _FASTPATH_LABEL_INDEX[stale]
+            _FASTPATH_LABEL_INDEX[key] = index
+    return index
+
+
+def _cypher_string(value):
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def match_question_template(question, schema_entry, kg_id=None):
+    """
+    Slot-fill the fast-path templates against `schema_entry` (the cached schema of `kg_id`).
+    Returns {"template", "label", "entity", "confidence", "cypher"} for the best shape
+    (confidence in 0..1), or None if no shape matches.
+    """
+    text = " ".join((question or "").lower().replace("?", " ").replace("’", "'").split()).rstrip(".!")
+    for name, pattern in _FASTPATH_SHAPES:
+        m = pattern.match(text)
+        if not m:
+            continue
+        x_key = _fastpath_key(m.group("x"))
+        entity = re.sub(r"^(?:the|a|an)\s+", "", m.group("y").strip(" -'\""))
+        labels = _fastpath_labels(schema_entry, kg_id)
+        label, confidence = labels.get(x_key), 1.0
+        if label is None and labels:
+            scored = sorted(((difflib.SequenceMatcher(None, x_key, k).ratio(), k) for k in labels), reverse=True)
+            confidence, best = scored[0]
+            if len(scored) > 1 and scored[0][0] - scored[1][0] < 0.05:
+                confidence -= 0.2   # two labels about equally close: ambiguous
+            label = labels[best]
+        # one short entity only; conjunctions/lists and qualified phrases need the LLM
+        if (not entity or len(entity.split()) > 4 or re.search(r"\b(?:and|or)\b|,", entity)
+                or _FASTPATH_QUALIFIERS.intersection(entity.split())):
+            confidence = 0.0
+        rel = "-[r]-" if FASTPATH_HOPS <= 1 else f"-[r*..{FASTPATH_HOPS}]-"
+        cypher = (f"MATCH path = (x:{cypher_label(label)}){rel}(d) "
+                  f"WHERE toLower(d.name) CONTAINS {_cypher_string(entity)} "
+                  f"RETURN path LIMIT {FASTPATH_LIMIT}") if label else None
+        return {"template": name, "label": label, "entity": entity,
+                "confidence": round(max(confidence, 0.0), 3), "cypher": cypher}
+    return None
+
+
+def _entity_is_node_name(gaz, entity):
+    """True if the whole entity is the name of at least one KG node (per the gazetteer)."""
+    tokens = " ".join(_name_tokens(entity))
+    return bool(tokens) and any(m["text"] == tokens for m in gaz.find_mentions(entity))
+
+
+def fastpath_cypher(question, kg_id, gaz=None):
+    """
+    Template Cypher for `question` on this KG if the fast-path is confident enough and the entity
+    is a node name known to the KG's gazetteer `gaz`, else None (also while `gaz` is None).
+    """
+    if not FASTPATH_ENABLED:
+        return None
+    entry = peek_schema_entry(kg_id)
+    if entry is None:
+        return None
+    t0 = time.perf_counter()
+    match = match_question_template(question, entry, kg_id)
+    hit = bool(match and match["cypher"] and match["confidence"] >= FASTPATH_MIN_CONFIDENCE)
+    unknown = hit and (gaz is None or not _entity_is_node_name(gaz, match["entity"]))
+    hit = hit and not unknown
+    took_ms = round((time.perf_counter() - t0) * 1000, 2)
+    with _FASTPATH_STATS_LOCK:
+        _FASTPATH_STATS["checked"] += 1
+        if hit:
+            _FASTPATH_STATS["hits"] += 1
+        elif unknown:
+            _FASTPATH_STATS["unknown_entity"] += 1
+        elif match:
+            _FASTPATH_STATS["low_confidence"] += 1
+        else:
+            _FASTPATH_STATS["no_shape"] += 1
+    if match:
+        outcome = "hit" if hit else "fallback (entity not a KG name)" if unknown else "fallback"
+        print(f"[fast-path] {outcome} {match['template']} label={match['label']!r} "
+              f"entity={match['entity']!r} confidence={match['confidence']} in {took_ms}ms")
+    return dict(match, took_ms=took_ms) if hit else None
+
+
+def fastpath_metrics():
+    with _FASTPATH_STATS_LOCK:
+        stats = dict(_FASTPATH_STATS)
+    stats["hit_rate"] = round(stats["hits"] / stats["checked"], 3) if stats["checked"] else 0.0
+    stats["llm_calls_saved"] = stats["hits"]
+    return stats
+
+
+# ---- entity gazetteer ----
+# Per KG, every node name with its element id and labels is pulled in the background on first
+# use. Every CGEX_GAZETTEER_REFRESH_S the KG's node count is re-checked, and the names are
+# re-pulled only if it changed. Names are indexed by their token
+# sequence (a token trie flattened to first token -> phrase lengths), so the mentions in a
+# question are found by longest match in one pass. Grounded mentions are listed in the prompt
+# tail, and while the snapshot is fresh and the KG's node count is unchanged,
+# `toLower(v.name) CONTAINS 'lit'` predicates that match only a few nodes are seeded with an
+# `elementId(v) IN [...]` lookup for execution (the CONTAINS check is kept).
+GAZETTEER_ENABLED = os.getenv("CGEX_GAZETTEER", "1").lower() not in ("0", "false", "no", "off")
+GAZETTEER_REFRESH_S = float(os.getenv("CGEX_GAZETTEER_REFRESH_S", "600"))
+GAZETTEER_MAX_NAMES = int(os.getenv("CGEX_GAZETTEER_MAX_NAMES", "1000000"))
+GAZETTEER_REWRITE_MAX_IDS = int(os.getenv("CGEX_GAZETTEER_REWRITE_MAX_IDS", "50"))
+
+_NAME_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_CONTAINS_NAME = re.compile(
+    r"toLower\(\s*([A-Za-z_][A-Za-z0-9_]*)\.name\s*\)\s+CONTAINS\s+('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")",
+    re.IGNORECASE)
+
+
+_PATTERN_NODE_VAR = re.compile(r"(?<![\w`$])\(\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?=[:){])")
+_PATTERN_REL_VAR = re.compile(r"\[\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?=[:\]{*])")
+
+
+def _node_variables(masked):
+    """Variables bound as nodes (`(v:Label)`, `(v)`) in an already literal-masked query."""
+    rels = set(_PATTERN_REL_VAR.findall(masked))
+    return {v for v in _PATTERN_NODE_VAR.findall(masked) if v not in rels}
+
+
+def _name_tokens(text):
+    return tuple(_NAME_TOKEN_RE.findall((text or "").lower()))
+
+
+class Gazetteer:
+    def __init__(self, kg_id):
+        self.kg_id = kg_id
+        self.lock = threading.Lock()
+        self.ids, self.names, self.labels = [], [], []   # parallel arrays, one entry per node
+        self.phrases = {}       # name token tuple -> [entry index]
+        self.lengths = {}       # first token -> {phrase lengths}
+        self.node_count = None  # all nodes in the KG when the snapshot was taken
+        self.refreshed_at = 0.0
+        self.ready = False
+        self.complete = False
+        self._blob = None       # "\x00".join(lower names) for substring search, rebuilt lazily
+        self._starts = None
+
+    def _add(self, element_id, name, labels):
+        i = len(self.ids)
+        self.ids.append(element_id)
+        self.names.append(name)
+        self.labels.append(":".join(labels or []))
+        tokens = _name_tokens(name)
+        if tokens:
+            self.phrases.setdefault(tokens, []).append(i)
+            self.lengths.setdefault(tokens[0], set()).add(len(tokens))
+
+    def refresh(self, uri, username, password):
+        """
+        Re-check the KG's node count (count store, O(1)); only if it changed since the snapshot
+        (or there is none yet) rebuild from a full scan of named nodes (element ids, so deleted
+        and re-used nodes are picked up) and swap it in. Returns the names loaded (0 if unchanged).
+        """
+        with self.lock:
+            have_snapshot, snapshot_count = self.ready, self.node_count
+        fresh = Gazetteer(self.kg_id)
+        with kg_session(uri, username, password, default_access_mode=neo4j_mod.READ_ACCESS) as session:
+            with session.begin_transaction() as tx:
+                node_count = tx.run("MATCH (n) RETURN count(n) AS nodes").single()["nodes"]
+                if have_snapshot and node_count == snapshot_count:
+                    with self.lock:
+                        self.refreshed_at = time.time()
+                    return 0
+                result = tx.run("MATCH (n) WHERE n.name IS :: STRING NOT NULL "
+                                "RETURN elementId(n) AS id, n.name AS name, labels(n) AS labels")
+                for r in result:
+                    if len(fresh.ids) >= GAZETTEER_MAX_NAMES:
+                        break
+                    fresh._add(r["id"], r["name"], r["labels"])
+                capped = len(fresh.ids) >= GAZETTEER_MAX_NAMES and result.peek() is not None
+        with self.lock:
+            self.ids, self.names, self.labels = fresh.ids, fresh.names, fresh.labels
+            self.phrases, self.lengths = fresh.phrases, fresh.lengths
+            self._blob = self._starts = None
+            self.node_count = node_count
+            self.refreshed_at = time.time()
+            self.ready = True
+            # a capped gazetteer is fine for hints, but CONTAINS rewrites need every name
+            self.complete = not capped
+        return len(fresh.ids)
+
+    def unchanged(self, uri, username, password):
+        """
+        True if this complete snapshot may back a rewrite: no older than the refresh interval and
+        the KG's node count (read from the count store) is what it was when the snapshot was taken.
+        """
+        with self.lock:
+            if not self.complete or time.time() - self.refreshed_at > GAZETTEER_REFRESH_S:
+                return False
+            node_count = self.node_count
+        try:
+            with kg_session(uri, username, password, default_access_mode=neo4j_mod.READ_ACCESS) as session:
+                same = session.run("MATCH (n) RETURN count(n) AS nodes").single()["nodes"] == node_count
+            if not same:
+                with self.lock:
+                    self.refreshed_at = 0.0   # stale: hints only until gazetteer_for() has it rebuilt
+            return same
+        except Exception as e:
+            print(f"⚠️ Gazetteer change check for {self.kg_id} failed: {e}")
+            return False
+
+    def find_mentions(self, question):
+        """Longest-match KG names in the question: [{"text", "nodes": [{"id", "name", "labels"}]}]."""
+        tokens = _name_tokens(question)
+        mentions, i = [], 0
+        with self.lock:
+            while i < len(tokens):
+                hit = None
+                for n in sorted(self.lengths.get(tokens[i], ()), reverse=True):
+                    phrase = tuple(tokens[i:i + n])
+                    if len(phrase) == n and phrase in self.phrases:
+                        hit = phrase
+                        break
+                # single stopwords / very short tokens are not entity mentions
+                if hit and (len(hit) > 1 or (hit[0] not in _QUESTION_STOPWORDS and len(hit[0]) > 2)):
+                    nodes = [{"id": self.ids[j], "name": self.names[j], "labels": self.labels[j]}
+                             for j in self.phrases[hit][:10]]
+                    mentions.append({"text": " ".join(hit), "nodes": nodes})
+                    i += len(hit)
+                else:
+                    i += 1
+        return mentions
+
+    def ids_containing(self, literal, cap):
+        """Element ids of nodes whose lowercased name contains `literal`; None if more than `cap`."""
+        with self.lock:
+            if self._blob is None:
+                lowered = [str(n).lower() for n in self.names]
+                self._starts, pos = [], 0
+                for name in lowered:
+                    self._starts.append(pos)
+                    pos += len(name) + 1
+                self._blob = "\x00".join(lowered)
+            blob, starts, ids = self._blob, self._starts, self.ids
+        found, pos = [], blob.find(literal)
+        while pos != -1:
+            j = bisect.bisect_right(starts, pos) - 1
+            found.append(ids[j])
+            if len(found) > cap:
+                return None
+            pos = blob.find(literal, starts[j + 1] if j + 1 < len(starts) else len(blob))
+        return found
+
+    def metrics(self):
+        with self.lock:
+            return {"names": len(self.ids), "phrases": len(self.phrases), "ready": self.ready,
+                    "complete": self.complete, "node_count": self.node_count,
+                    "age_s": round(time.time() - self.refreshed_at, 1) if self.refreshed_at else None}
+
+
+_GAZETTEERS = {}
+_GAZETTEER_BUILDING = set()
+_GAZETTEER_LOCK = threading.Lock()
+_GAZETTEER_STATS = {"questions": 0, "mentions": 0, "predicates": 0, "rewritten": 0, "too_many_matches": 0}
+
+
+def _build_gazetteer(gaz, uri, username, password):
+    try:
+        t0 = time.perf_counter()
+        added = gaz.refresh(uri, username, password)
+        if added:
+            print(f"[gazetteer] {gaz.kg_id}: {added} names in {time.perf_counter() - t0:.1f}s")
+    except Exception as e:
+        print(f"⚠️ Gazetteer refresh for {gaz.kg_id} failed: {e}")
+    finally:
+        with _GAZETTEER_LOCK:
+            _GAZETTEER_BUILDING.discard(gaz.kg_id)
+
+
+def gazetteer_for(uri, username, password):
+    """This KG's gazetteer if built (None while the first build runs in the background)."""
+    if not GAZETTEER_ENABLED:
+        return None
+    kg_id = kg_id_for_uri(uri)
+    with _GAZETTEER_LOCK:
+        gaz = _GAZETTEERS.setdefault(kg_id, Gazetteer(kg_id))
+        stale = not gaz.ready or time.time() - gaz.refreshed_at > GAZETTEER_REFRESH_S
+        if stale and kg_id not in _GAZETTEER_BUILDING:
+            _GAZETTEER_BUILDING.add(kg_id)
+            threading.Thread(target=_build_gazetteer, args=(gaz, uri, username, password),
+                             name=f"gazetteer-{kg_id}", daemon=True).start()
+    return gaz if gaz.ready else None
+
+
+def invalidate_gazetteer(kg_id=None):
+    """Drop gazetteers (e.g. after the schema changed) so the next use rebuilds from scratch."""
+    with _GAZETTEER_LOCK:
+        for k in ([kg_id] if kg_id else list(_GAZETTEERS)):
+            if k not in _GAZETTEER_BUILDING:
+                _GAZETTEERS.pop(k, None)
+
+
+def question_mentions(gaz, question):
+    if gaz is None:
+        return []
+    mentions = gaz.find_mentions(question)
+    with _GAZETTEER_LOCK:
+        _GAZETTEER_STATS["questions"] += 1
+        _GAZETTEER_STATS["mentions"] += len(mentions)
+    if mentions:
+        print(f"[gazetteer] mentions: {[(m['text'], len(m['nodes'])) for m in mentions]}")
+    return mentions
+
+
+def grounding_hints(mentions):
+    """Prompt-tail block listing the exact KG names behind the question's entity mentions."""
+    if not mentions:
+        return None
+    lines = ["Entities mentioned in the question that exist in the KG (exact node names and labels):"]
+    for m in mentions:
+        shown = ", ".join(f'"{n["name"]}"' + (f' [{n["labels"]}]' if n["labels"] else "") for n in m["nodes"][:5])
+        lines.append(f"- {m['text']}: {shown}")
+    return "\n".join(lines)
+
+
+def ground_cypher(cypher, gaz, max_ids=GAZETTEER_REWRITE_MAX_IDS):
+    """
+    Seed `toLower(v.name) CONTAINS 'lit'` with `elementId(v) IN [...]` when the gazetteer knows at
+    most `max_ids` matching nodes; the CONTAINS check itself stays, so a node renamed since the
+    snapshot cannot add rows. Pass the gazetteer only if `gaz.unchanged(...)`. Returns (cypher, report).
+    """
+    report = {"predicates": 0, "rewritten": []}
+    if gaz is None or not gaz.complete:
+        return cypher, report
+    masked = _mask_cypher_literals(cypher)
+    node_vars = _node_variables(masked)
+    edits = []
+    for m in _CONTAINS_NAME.finditer(cypher):
+        if masked[m.start():m.start(2)] != cypher[m.start():m.start(2)]:
+            continue  # inside a string literal
+        report["predicates"] += 1
+        if m.group(1) not in node_vars:
+            continue  # relationship, map or list variable: elementId() of a node list would not match it
+        literal = re.sub(r"\\(.)", r"\1", m.group(2)[1:-1])
+        if not literal:
+            continue
+        ids = gaz.ids_containing(literal, max_ids)
+        if ids is None:
+            report.setdefault("too_many_matches", []).append(literal)
+            continue
+        id_list = ", ".join(_cypher_string(i) for i in ids)
+        edits.append((m.start(), m.end(), f"(elementId({m.group(1)}) IN [{id_list}] AND {m.group(0)})"))
+        report["rewritten"].append({"var": m.group(1), "literal": literal, "ids": len(ids)})
+    with _GAZETTEER_LOCK:
+        _GAZETTEER_STATS["predicates"] += report["predicates"]
+        _GAZETTEER_STATS["rewritten"] += len(report["rewritten"])
+        _GAZETTEER_STATS["too_many_matches"] += len(report.get("too_many_matches", []))
+    if edits:
+        print(f"[gazetteer] grounded {report['rewritten']}")
+    return _apply_edits(cypher, edits), report
+
+
+def gazetteer_metrics():
+    with _GAZETTEER_LOCK:
+        out = {"totals": dict(_GAZETTEER_STATS)}
+        gazetteers = dict(_GAZETTEERS)
+    for kg_id, gaz in gazetteers.items():
+        out[kg_id] = gaz.metrics()
+    return out
+
+
+# ---- full-text seeded CONTAINS filters ----
+# Opt-in (python cgex.py --create-fulltext-index kg1) full-text index `cgex_name_fulltext` on `name`
+# for every schema label. Once it is ONLINE and covers every label, a generated query whose WHERE
+# has a top-level conjunct made only of `toLower(v.name) CONTAINS '<single token>'` predicates on
+# one variable gets v seeded from the index; the original WHERE stays, so the seed can only drop
+# rows the index misses (python cgex.py --check-fulltext kg1 compares result sets on the examples).
+FULLTEXT_INDEX_NAME = "cgex_name_fulltext"
+FULLTEXT_REWRITE = os.getenv("CGEX_FULLTEXT_REWRITE", "1").lower() not in ("0", "false", "no", "off")
+_FULLTEXT_STATE = {}   # kg_id -> (checked_at, ready)
+_FT_TOKEN = re.compile(r"^[a-z0-9]+$")
+
+
+def create_fulltext_index(uri, username, password):
+    """Opt-in: (re)create the cgex_name_fulltext index over `name` for all schema labels and wait for it."""
+    labels = schema_labels(extract_schema(uri, username, password))
+    if not labels:
+        print("[fulltext] no labels in the schema; nothing to index")
+        return
+    with kg_session(uri, username, password) as session:
+        existing = session.run("SHOW FULLTEXT INDEXES YIELD name, labelsOrTypes WHERE name = $name "
+                               "RETURN labelsOrTypes", name=FULLTEXT_INDEX_NAME).single()
+        if existing and set(existing["labelsOrTypes"] or []) != set(labels):
+            print(f"[fulltext] label set changed; recreating {FULLTEXT_INDEX_NAME}")
+            session.run(f"DROP INDEX {FULLTEXT_INDEX_NAME} IF EXISTS").consume()
+        label_expr = "|".join(cypher_label(label) for label in labels)
+        session.run(f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX_NAME} IF NOT EXISTS "
+                    f"FOR (n:{label_expr}) ON EACH [n.name]").consume()
+        session.run("CALL db.awaitIndex($name, 600)", name=FULLTEXT_INDEX_NAME).consume()
+    _FULLTEXT_STATE.pop(kg_id_for_uri(uri), None)
+    print(f"[fulltext] {FULLTEXT_INDEX_NAME} ready for {len(labels)} labels")
+
+
+def fulltext_index_ready(uri, username, password):
+    """True if cgex_name_fulltext is ONLINE and covers every schema label (checked every few minutes)."""
+    kg_id = kg_id_for_uri(uri)
+    checked_at, ready = _FULLTEXT_STATE.get(kg_id, (0, False))
+    if time.time() - checked_at < NAME_INDEX_CHECK_TTL_S:
+        return ready
+    ready = False
+    try:
+        with kg_session(uri, username, password) as session:
+            rec = session.run("SHOW FULLTEXT INDEXES YIELD name, labelsOrTypes, properties, state "
+                              "WHERE name = $name RETURN labelsOrTypes, properties, state",
+                              name=FULLTEXT_INDEX_NAME).single()
+        if rec and rec["state"] == "ONLINE" and rec["properties"] == ["name"]:
+            wanted = set(schema_labels(get_schema(uri, username, password)))
+            ready = bool(wanted) and wanted <= set(rec["labelsOrTypes"] or [])
+    except Exception as e:
+        print(f"⚠️ Could not inspect the full-text index: {e}")
+    _FULLTEXT_STATE[kg_id] = (time.time(), ready)
+    return ready
+
+
+def _split_top_level(masked, text, keyword):
+    """Split `text` at top-level (not nested, not in literals) occurrences of `keyword` (e.g. AND)."""
+    pattern = re.compile(rf"\b{keyword}\b", re.IGNORECASE)
+    parts, start = [], 0
+    for m in _top_level_spans(masked, pattern):
+        parts.append(text[start:m.start()])
+        start = m.end()
+    parts.append(text[start:])
+    return parts
+
+
+def _seed_conjunct(conjunct):
+    """(variable, [literals]) if the conjunct is only same-variable single-token CONTAINS filters."""
+    body = conjunct.strip()
+    while body.startswith("(") and body.endswith(")"):
+        depth_at = [0]
+        for ch in _mask_cypher_literals(body)[:-1]:
+            depth_at.append(depth_at[-1] + (ch in "([{") - (ch in ")]}"))
+        if min(depth_at[1:]) < 1:   # the first "(" closes before the end: "(a) OR (b)"
+            break
+        body = body[1:-1].strip()
+    var, literals = None, []
+    masked = _mask_cypher_literals(body)
+    for disjunct in _split_top_level(masked, body, "OR"):
+        m = _CONTAINS_NAME.fullmatch(disjunct.strip())
+        if not m:
+            return None
+        literal = m.group(2)[1:-1]
+        if not _FT_TOKEN.match(literal) or (var is not None and m.group(1) != var):
+            return None
+        var = m.group(1)
+        literals.append(literal)
+    return (var, literals) if var else None
+
+
+def fulltext_seed_cypher(cypher):
+    """
+    Seed one variable of a single-MATCH query from cgex_name_fulltext. Returns (cypher, report);
+    the query is returned unchanged when no conjunct qualifies.
+    """
+    report = {"seeded": None}
+    masked = _mask_cypher_literals(cypher)
+    clauses = _top_level_spans(masked, re.compile(r"\b(OPTIONAL\s+MATCH|MATCH|WHERE|WITH|RETURN|UNION|CALL|UNWIND)\b",
+                                                  re.IGNORECASE))
+    names = [m.group(1).upper() for m in clauses]
+    if names[:3] != ["MATCH", "WHERE", "RETURN"] or len(names) != 3 or clauses[0].start() != 0:
+        return cypher, report
+    where_start, where_end = clauses[1].end(), clauses[2].start()
+    where = cypher[where_start:where_end]
+    seed = None
+    node_vars = _node_variables(masked[clauses[0].end():clauses[1].start()])
+    for conjunct in _split_top_level(masked[where_start:where_end], where, "AND"):
+        found = _seed_conjunct(conjunct)
+        if found and found[0] in node_vars:
+            if seed is None or len(found[1]) < len(seed[1]):
+                seed = found
+    if seed is None:
+        return cypher, report
+    var, literals = seed
+    query = " OR ".join(f"*{lit}*" for lit in literals)
+    report["seeded"] = {"var": var, "query": query}
+    return (f"CALL db.index.fulltext.queryNodes('{FULLTEXT_INDEX_NAME}', {_cypher_string(query)}) "
+            f"YIELD node AS {var} WITH {var} {cypher}"), report
+
+
+def _strip_final_limit(cypher):
+    masked = _mask_cypher_literals(cypher)
+    limits = _top_level_spans(masked, re.compile(r"\bLIMIT\s+\S+", re.IGNORECASE))
+    if limits and not masked[limits[-1].end():].strip():
+        return cypher[:limits[-1].start()].rstrip()
+    return cypher
+
+
+def check_fulltext_rewrite(uri, username, password, repeat=3):
+    """
+    For every example Cypher the rewrite applies to: compare the full result sets (LIMIT removed)
+    of original vs seeded query and the latency (best of `repeat`, LIMIT kept). Prints a report.
+    """
+    if not fulltext_index_ready(uri, username, password):
+        print(f"[fulltext] {FULLTEXT_INDEX_NAME} is missing or does not cover every label; "
+              f"run --create-fulltext-index first")
+        return []
+
+    def timed(q):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            run_read_query(q, uri, username, password)
+            best = min(best, time.perf_counter() - t0)
+        return round(best * 1000, 1)
+
+    def result_set(q):
+        rows, _, _, truncated = run_read_query(_strip_final_limit(q), uri, username, password)
+        return Counter(safe_json(r, compact=True) for r in rows), truncated
+
+    report = []
+    for ex in load_examples(EXAMPLES_FILE_PATH):
+        original = ex["example cypher"]
+        seeded, info = fulltext_seed_cypher(normalize_cypher(original))
+        if not info["seeded"]:
+            continue
+        entry = {"question": ex["example question"].strip(), "seed": info["seeded"]["query"]}
+        try:
+            before, trunc_a = result_set(original)
+            after, trunc_b = result_set(seeded)
+            entry["verdict"] = ("inconclusive (row cap)" if trunc_a or trunc_b
+                                else "same" if before == after else
+                                f"DIFFERENT ({sum(before.values())} vs {sum(after.values())} rows)")
+            entry["before_ms"], entry["after_ms"] = timed(original), timed(seeded)
+        except Exception as e:
+            entry["verdict"] = f"error: {e}"
+        report.append(entry)
+        print(f"[fulltext] {entry['verdict']:>28}  {entry.get('before_ms', '-'):>8} ms → "
+              f"{entry.get('after_ms', '-'):>8} ms  {entry['question']}  [{entry['seed']}]")
+    same = sum(1 for e in report if e["verdict"] == "same")
+    print(f"[fulltext] {same}/{len(report)} rewritten example queries return identical result sets")
+    return report
+
+
+def _message_text(msg):
     # Prefer plain string content
     txt = msg.content if isinstance(getattr(msg, "content", ""), str) else ""
 
@@ -1123,35 +3259,163 @@ def run_pipeline_direct(question, graph, uri, http_url, username, password, prom
     if not txt:
         ak = getattr(msg, "additional_kwargs", {}) or {}
         txt = (ak.get("content") or ak.get("message") or "").strip()
+    return txt
 
-    
-    print("\n--- GPT-5 raw (first 800 chars) ---\n", txt[:800], "\n-----------------------------------\n")
 
-    m = CY_CODE_BLOCK.search(txt) or CY_FALLBACK.search(txt)
-    cypher = m.group(1).strip() if m else None
-    if cypher:
-        cypher = re.sub(r"\s+", " ", cypher.replace("\\", " ").replace("\n", " ")).strip()
-        results = execute_cypher(cypher, uri, username, password)
-        detailed = generate_detailed_response(results)
+# Worker threads for the independent post-execution branches (explanation LLM call vs. graph building)
+_PIPELINE_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("CGEX_PIPELINE_WORKERS", "8")),
+                                    thread_name_prefix="cgex-pipeline")
 
 
-        
-        # 🔹 Fetch the graph via Bolt (Aura-compatible)
-        nodes, rels = fetch_graph_via_bolt(cypher, uri, username, password, db="neo4j")
-        elements = graph_to_cytoscape(nodes, rels)
+@contextmanager
+def stage_timer(timings, name):
+    """Record the wall time of a pipeline stage (seconds) into `timings[name]`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - t0, 3)
+
 
+def _timed(timings, name, fn, *args, **kwargs):
+    with stage_timer(timings, name):
+        return fn(*args, **kwargs)
+
+
+def build_solution_graph(uri, username, password, nodes, rels, results):
+    """Cytoscape elements for the solution subgraph (graph projection → fallback → label enrichment)."""
+    elements = graph_to_cytoscape(nodes, rels)
+
+    # If HTTP graph somehow fails but we have tabular results, fall back
+    if not elements and results:
+        elements = neo4j_to_cytoscape_exact(results)
+
+    # Enrich labels for coloring — only nodes that came back without labels need a lookup
+    elements, _ = enrich_labels_stage(uri, username, password, elements)
+
+    node_labels = [e["data"].get("labels_str", "") for e in elements if "source" not in e["data"]]
+    print("[solution-graph] labels_str unique:", sorted({x for x in node_labels if x})[:12])
+    return elements
 
-        # If HTTP graph somehow fails but we have tabular results, fall back
-        if not elements and results:
-            elements = neo4j_to_cytoscape_exact(results)
 
-        # Enrich labels for coloring (works the same as before)
-        elements = enrich_labels_by_name(uri, username, password, elements)
+def run_pipeline_direct(question, graph, uri, http_url, username, password, prompt_template, use_few_shot=False,
+                        schema_version=None, on_progress=None, cancel_event=None):
+    """
+    Question → Cypher → results/explanation/graph.
+    If `on_progress(field, value)` is given, each output ("prompt", "cypher", "results",
+    "elements", "detailed") is pushed as soon as it is ready and the explanation is streamed.
+    Setting `cancel_event` aborts the run with PipelineCancelled at the next stage boundary.
+    """
+    kg_id = kg_id_for_uri(uri)
+    timings = {}
+    progress = on_progress or (lambda field, value: None)
+    examples, fewshot = None, None
+    if use_few_shot:
+        examples, fewshot = select_examples(question, load_examples(EXAMPLES_FILE_PATH))
+    # entity mentions grounded against the KG's gazetteer (None until its first build has finished)
+    gaz = gazetteer_for(uri, username, password)
+    mentions = question_mentions(gaz, question)
+    llm_input, prompt_text = build_llm_input(prompt_template, question, examples, hints=grounding_hints(mentions))
+    if fewshot:
+        chosen = "; ".join(f"{c['question']} ({c['score']})" for c in fewshot["chosen"]) or "none relevant"
+        prompt_text = (f"[Few-shot: {len(fewshot['chosen'])} of {fewshot['candidates']} approved examples, "
+                       f"{fewshot['tokens']} tokens: {chosen}]\n\n{prompt_text}")
+
+    # Disapprove (few-shot) means the cached translation was rejected: drop it and regenerate
+    cached = None
+    if use_few_shot:
+        QUESTION_CACHE.discard(kg_id, schema_version, question)
+    elif schema_version:
+        cached = QUESTION_CACHE.get(kg_id, schema_version, question)
+
+    # Disapprove asked for a fresh generation, so only plain submits take the template fast-path
+    fast = None if (cached or use_few_shot) else fastpath_cypher(question, kg_id, gaz)
+
+    if cached:
+        print(f"[qcache] {cached['match']} hit ({cached['similarity']}) ← {cached['question']!r}")
+        txt = f"```cypher\n{cached['cypher']}\n```"
+        prompt_text = (f"[Cypher served from the question cache ({cached['match']} match, similarity "
+                       f"{cached['similarity']}) for: {cached['question']}]\n\n{prompt_text}")
+    elif fast:
+        txt = f"```cypher\n{fast['cypher']}\n```"
+        prompt_text = (f"[Cypher built by the template fast-path ({fast['template']}: {fast['label']} "
+                       f"associated with '{fast['entity']}', confidence {fast['confidence']}); "
+                       f"no LLM call]\n\n{prompt_text}")
+    else:
+        check_cancelled(cancel_event)
+        with stage_timer(timings, "llm_cypher"):
+            msg = get_llm().invoke(llm_input)
+        record_llm_usage(msg, "cypher", timings["llm_cypher"])
+        txt = _message_text(msg)
 
-        node_labels = [e["data"].get("labels_str", "") for e in elements if "source" not in e["data"]]
-        print("[solution-graph] labels_str unique:", sorted({x for x in node_labels if x})[:12])
+        print("\n--- GPT-5 raw (first 800 chars) ---\n", txt[:800], "\n-----------------------------------\n")
+    progress("prompt", prompt_text)
 
-        return prompt_text, cypher, safe_json(results), detailed, elements
+    m = CY_CODE_BLOCK.search(txt) or CY_FALLBACK.search(txt)
+    cypher = m.group(1).strip() if m else None
+    if cypher:
+        cypher = re.sub(r"\s+", " ", cypher.replace("\\", " ").replace("\n", " ")).strip()
+        check_cancelled(cancel_event)
+        try:
+            with stage_timer(timings, "guard"):
+                # the shown/approved Cypher keeps its CONTAINS predicates; the executed one may be grounded
+                cypher, _ = guard_cypher(cypher, explain=False)
+                grounded_by = gaz if gaz is not None and gaz.unchanged(uri, username, password) else None
+                exec_cypher, _ = ground_cypher(cypher, grounded_by)
+                if FULLTEXT_REWRITE and fulltext_index_ready(uri, username, password):
+                    exec_cypher, _ = fulltext_seed_cypher(exec_cypher)
+                exec_cypher, _ = guard_cypher(exec_cypher, explain=False)
+                # a cached result means this exact query already passed the EXPLAIN row estimate
+                if not RESULT_CACHE.contains(ResultCache.key(kg_id, exec_cypher, None, "neo4j"), schema_version):
+                    exec_cypher, _ = guard_cypher(exec_cypher, uri, username, password, db="neo4j")
+        except CypherGuardError as e:
+            progress("cypher", cypher)
+            return prompt_text, cypher, None, f"⚠️ Query rejected by the Cypher guard: {e}", []
+        progress("cypher", cypher)
+        # 🔹 Records + graph via Bolt (Aura-compatible), from the result cache when possible
+        # rows are rendered into the results pane as they stream in: at most twice a second, and only
+        # once the row count has doubled since the last push, so re-rendering the growing pane costs
+        # O(rows) in total rather than O(rows²)
+        results_writer, exec_stats = JsonArrayWriter(), {}
+        last_push, next_push_rows = [time.perf_counter()], [50]
+
+        def on_row(row):
+            results_writer.add(row)
+            if (on_progress and len(results_writer) >= next_push_rows[0]
+                    and time.perf_counter() - last_push[0] > 0.5):
+                last_push[0] = time.perf_counter()
+                next_push_rows[0] = 2 * len(results_writer)
+                progress("results", results_writer.getvalue() + "\n… (still streaming)")
+
+        with stage_timer(timings, "execute"):
+            results, nodes, rels = run_cypher_cached(exec_cypher, uri, username, password, db="neo4j",
+                                                     schema_version=schema_version, cancel_event=cancel_event,
+                                                     on_row=on_row, stats=exec_stats)
+        if not cached and schema_version:
+            QUESTION_CACHE.put(kg_id, schema_version, question, cypher)
+        check_cancelled(cancel_event)
+        results_json = results_writer.getvalue(exec_stats.get("truncated"))
+        progress("results", results_json)
+
+        # The explanation LLM call and the graph branch are independent: overlap them
+        if on_progress:
+            explain = lambda res: stream_detailed_response(res, on_token=lambda text: progress("detailed", text),
+                                                           cancel_event=cancel_event)
+        else:
+            explain = generate_detailed_response
+        # compact, token-budgeted view of the result for the explanation prompt
+        with stage_timer(timings, "compact"):
+            explain_payload, compact_stats = compact_results_for_llm(results, nodes, rels)
+            if exec_stats.get("truncated"):
+                explain_payload += f"\n(Only the first {len(results)} rows of the query result were retrieved.)"
+        with stage_timer(timings, "post_execute"):
+            explain_future = _PIPELINE_POOL.submit(_timed, timings, "explanation", explain, explain_payload)
+            elements = _timed(timings, "graph", build_solution_graph, uri, username, password, nodes, rels, results)
+            progress("elements", elements)
+            detailed = explain_future.result()
+        print("[timings]", timings)
+
+        return prompt_text, cypher, results_json, detailed, elements
         
         #return prompt_text, cypher, json.dumps(results, indent=2), detailed
     preview = txt if len(txt) < 1500 else txt[:1500] + "\n...[truncated]"
@@ -1159,26 +3423,307 @@ def run_pipeline_direct(question, graph, uri, http_url, username, password, prom
     return prompt_text, None, None, f"LLM returned no Cypher.\n\nRaw output preview:\n\n{preview}", []
 
 
+# ---- pipeline jobs (progressive UI updates) ----
+# The Dash callback only enqueues a job and returns; a dcc.Interval polls the job and pushes
+# each output (Cypher, results, graph, streamed explanation) as soon as it is ready.
+# Jobs run on a bounded worker pool with a per-KG concurrency limit, so the Flask threads
+# stay free; a re-submit from the same browser cancels that user's previous job.
+# (Threads rather than processes: jobs share the pooled drivers and the in-process caches.)
+JOB_FIELDS = ("cypher", "detailed", "results", "prompt", "elements")
+JOB_RETENTION_S = 600
+JOB_WORKERS = int(os.getenv("CGEX_JOB_WORKERS", "8"))
+JOBS_PER_KG = int(os.getenv("CGEX_JOBS_PER_KG", "3"))
+
+_JOB_POOL = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="cgex-job")
+
+
+class PipelineJob:
+    def __init__(self, kg_id):
+        self.id = uuid.uuid4().hex
+        self.kg_id = kg_id
+        self.lock = threading.Lock()
+        self.values = {f: None for f in JOB_FIELDS}
+        self.versions = {f: 0 for f in JOB_FIELDS}
+        self.status = "queued"
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def update(self, field, value):
+        with self.lock:
+            self.values[field] = value
+            self.versions[field] += 1
+
+    def set_status(self, status):
+        with self.lock:
+            self.status = status
+            if status not in ("queued", "running"):
+                self.finished_at = time.time()
+
+    def finish(self, status="done"):
+        self.set_status(status)
+
+    def snapshot(self):
+        with self.lock:
+            return {"status": self.status, "values": dict(self.values), "versions": dict(self.versions)}
+
+
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+# per-KG admission happens before a job reaches the pool, so no pool thread ever waits for
+# another KG's slot: a job is submitted while its KG runs fewer than JOBS_PER_KG jobs, otherwise
+# it waits in that KG's pending queue and is submitted when one of them finishes
+_KG_RUNNING = {}    # kg_id -> jobs submitted to the pool and not finished
+_KG_PENDING = {}    # kg_id -> deque of (job, args, kwargs) waiting for a slot
+
+
+def _submit_job(job, args, kwargs):
+    job.future = _JOB_POOL.submit(_run_job, job, *args, **kwargs)
+
+
+def _release_kg_slot(kg_id):
+    """A job of this KG left the pool: hand its slot to the next pending job, if any."""
+    with _JOBS_LOCK:
+        pending = _KG_PENDING.get(kg_id)
+        while pending:
+            job, args, kwargs = pending.popleft()
+            if not job.cancel_event.is_set():
+                _submit_job(job, args, kwargs)
+                return
+            job.finish("cancelled")  # cancelled while it waited; never submitted
+        _KG_RUNNING[kg_id] -= 1
+
+
+def _run_job(job, question, uri, username, password, **pipeline_kwargs):
+    try:
+        if job.cancel_event.is_set():
+            job.finish("cancelled")
+            return
+        job.set_status("running")
+        prompt, cypher, results, detailed, elements = run_pipeline_direct(
+            question, None, uri, None, username, password, on_progress=job.update,
+            cancel_event=job.cancel_event, **pipeline_kwargs)
+        for field, value in (("prompt", prompt), ("cypher", cypher), ("results", results),
+                             ("detailed", detailed), ("elements", elements)):
+            job.update(field, value)
+        job.finish("done")
+    except PipelineCancelled:
+        print(f"[jobs] {job.id[:8]} cancelled")
+        job.finish("cancelled")
+    except Exception as e:
+        print(f"⚠️ Pipeline job {job.id} failed: {e}")
+        job.update("detailed", f"⚠️ Error: {e}")
+        job.finish("error")
+    finally:
+        _release_kg_slot(job.kg_id)
+
+
+def start_pipeline_job(question, uri, username, password, **pipeline_kwargs):
+    """Queue run_pipeline_direct on the job pool (or the KG's pending queue); returns the job id to poll."""
+    job = PipelineJob(kg_id_for_uri(uri))
+    args = (question, uri, username, password)
+    with _JOBS_LOCK:
+        # forget jobs whose results have long been delivered
+        for jid in [j for j, old in _JOBS.items() if old.finished_at and time.time() - old.finished_at > JOB_RETENTION_S]:
+            del _JOBS[jid]
+        _JOBS[job.id] = job
+        if _KG_RUNNING.get(job.kg_id, 0) < JOBS_PER_KG:
+            _KG_RUNNING[job.kg_id] = _KG_RUNNING.get(job.kg_id, 0) + 1
+            _submit_job(job, args, pipeline_kwargs)
+        else:
+            _KG_PENDING.setdefault(job.kg_id, deque()).append((job, args, pipeline_kwargs))
+    return job.id
+
+
+def cancel_pipeline_job(job_id):
+    """Cancel a queued or running job (running ones stop at their next stage boundary; a KG query
+    in flight is terminated on the server)."""
+    job = get_pipeline_job(job_id)
+    if job is None or job.finished_at:
+        return False
+    with _JOBS_LOCK:
+        # set under the lock, so _release_kg_slot either submitted the job already or sees the flag
+        job.cancel_event.set()
+        pending = _KG_PENDING.get(job.kg_id, ())
+        waiting = [p for p in pending if p[0] is job]
+        for p in waiting:
+            pending.remove(p)
+    if waiting:
+        job.finish("cancelled")  # never submitted
+    elif job.future is not None and job.future.cancel():
+        job.finish("cancelled")  # submitted but never started
+        _release_kg_slot(job.kg_id)
+    else:
+        # don't wait for the next stage boundary if the job is blocked on a KG query
+        _PIPELINE_POOL.submit(terminate_cancelled_queries)
+    return True
+
+
+def get_pipeline_job(job_id):
+    with _JOBS_LOCK:
+        return _JOBS.get(job_id)
+
+
+def job_metrics():
+    with _JOBS_LOCK:
+        jobs = list(_JOBS.values())
+    out = {}
+    for job in jobs:
+        per_kg = out.setdefault(job.kg_id, {"queued": 0, "running": 0, "done": 0, "cancelled": 0, "error": 0})
+        per_kg[job.status] = per_kg.get(job.status, 0) + 1
+    return out
+
+
 from neo4j import GraphDatabase
 
-def enrich_labels_by_name(uri, username, password, elements, max_names=200):
+# ---- indexed name lookups ----
+# Opt-in migration (python cgex.py --migrate-name-index kg1) stores toLower(n.name) as n.name_lc
+# and creates a range index on it for every label. Once every schema label has an ONLINE
+# name_lc index, name lookups become a UNION of index seeks instead of a label-less scan.
+# Re-run the migration after bulk loads; it only touches nodes whose name_lc is missing/stale.
+NAME_INDEX_CHECK_TTL_S = float(os.getenv("CGEX_NAME_INDEX_CHECK_S", "300"))
+LABEL_CACHE_SIZE = int(os.getenv("CGEX_LABEL_CACHE_SIZE", "50000"))
+
+_NAME_INDEX_STATE = {}   # kg_id -> (checked_at, labels or None)
+_LABEL_CACHE = {}        # kg_id -> OrderedDict(lower(name) -> labels list, [] = known miss)
+_LABEL_CACHE_LOCK = threading.Lock()
+
+
+def migrate_name_lc_index(uri, username, password, batch_size=10000):
+    """Opt-in: set n.name_lc = toLower(n.name) on all named nodes and index it per label."""
+    labels = schema_labels(extract_schema(uri, username, password))
+    with kg_session(uri, username, password) as session:
+        summary = session.run(
+            """
+            MATCH (n) WHERE n.name IS NOT NULL AND (n.name_lc IS NULL OR n.name_lc <> toLower(toString(n.name)))
+            CALL { WITH n SET n.name_lc = toLower(toString(n.name)) } IN TRANSACTIONS OF $batch ROWS
+            """,
+            batch=batch_size,
+        ).consume()
+        print(f"[name-index] name_lc set on {summary.counters.properties_set} nodes")
+        for label in labels:
+            index_name = "cgex_name_lc_" + re.sub(r"\W", "_", label)
+            session.run(f"CREATE INDEX {index_name} IF NOT EXISTS FOR (n:{cypher_label(label)}) ON (n.name_lc)").consume()
+        session.run("CALL db.awaitIndexes(300)").consume()
+    _NAME_INDEX_STATE.pop(kg_id_for_uri(uri), None)
+    print(f"[name-index] indexes ready for {len(labels)} labels")
+
+
+def name_lc_index_labels(uri, username, password):
+    """Labels to seek on if name_lc indexes cover every schema label; None → use the scan fallback."""
+    kg_id = kg_id_for_uri(uri)
+    checked_at, labels = _NAME_INDEX_STATE.get(kg_id, (0, None))
+    if time.time() - checked_at < NAME_INDEX_CHECK_TTL_S:
+        return labels
+    labels = None
+    try:
+        with kg_session(uri, username, password) as session:
+            indexed = set()
+            for rec in session.run("SHOW INDEXES YIELD labelsOrTypes, properties, state, entityType "
+                                   "WHERE entityType = 'NODE' AND properties = ['name_lc'] AND state = 'ONLINE' "
+                                   "RETURN labelsOrTypes"):
+                indexed.update(rec["labelsOrTypes"] or [])
+        wanted = set(schema_labels(get_schema(uri, username, password)))
+        if wanted and wanted <= indexed:
+            labels = sorted(wanted)
+    except Exception as e:
+        print(f"⚠️ Could not inspect name_lc indexes: {e}")
+    _NAME_INDEX_STATE[kg_id] = (time.time(), labels)
+    return labels
+
+
+def indexed_name_match(labels, var="n"):
+    """
+    CALL-subquery body that resolves `nm` (lowercase name) to nodes via the name_lc index seeks.
+    Each UNION branch imports nm with a leading WITH (works on Neo4j 4.x/5.x, unlike `CALL (nm)`).
+    """
+    return "\n    UNION\n    ".join(
+        f"WITH nm MATCH ({var}:{cypher_label(label)}) WHERE {var}.name_lc = nm RETURN {var}" for label in labels
+    )
+
+
+def lookup_labels_by_name(uri, username, password, names_lc, stats=None):
+    """{lower(name): labels} for the given lowercase names, via the shared cache, then the index (or scan)."""
+    kg_id = kg_id_for_uri(uri)
+    found, missing = {}, []
+    with _LABEL_CACHE_LOCK:
+        cache = _LABEL_CACHE.setdefault(kg_id, OrderedDict())
+        for nm in names_lc:
+            if nm in cache:
+                cache.move_to_end(nm)
+                found[nm] = cache[nm]
+            else:
+                missing.append(nm)
+    if not missing:
+        if stats is not None:
+            stats["cache_hits"] = stats.get("cache_hits", 0) + len(found)
+        return found
+
+    scan_query = """
+        UNWIND $names AS nm
+        MATCH (n)
+        WHERE toLower(n.name) = nm
+        WITH nm, collect(distinct labels(n)) AS labsets
+        RETURN nm AS key, (CASE WHEN size(labsets) > 0 THEN labsets[0] ELSE [] END) AS labs
+        """
+    labels = name_lc_index_labels(uri, username, password)
+    fetched, round_trips = {}, 0
+    with kg_session(uri, username, password) as session:
+        if labels:
+            query = f"""
+            UNWIND $names AS nm
+            CALL {{
+                {indexed_name_match(labels)}
+            }}
+            WITH nm, collect(distinct labels(n)) AS labsets
+            RETURN nm AS key, (CASE WHEN size(labsets) > 0 THEN labsets[0] ELSE [] END) AS labs
+            """
+            try:
+                for r in session.run(query, names=missing):
+                    if r["labs"]:
+                        fetched[r["key"]] = list(r["labs"])
+                round_trips += 1
+            except CypherSyntaxError as e:
+                print(f"⚠️ Indexed name lookup rejected by the server, using the scan: {e}")
+        # nodes created after the migration have no name_lc yet: confirm index misses with the scan
+        unresolved = [nm for nm in missing if nm not in fetched]
+        if unresolved:
+            for r in session.run(scan_query, names=unresolved):
+                fetched[r["key"]] = list(r.get("labs") or [])
+            round_trips += 1
+    for nm in missing:
+        fetched.setdefault(nm, [])   # a miss confirmed by the scan is remembered too
+    if stats is not None:
+        stats["db_round_trips"] = stats.get("db_round_trips", 0) + round_trips
+        stats["cache_hits"] = stats.get("cache_hits", 0) + len(found)
+
+    with _LABEL_CACHE_LOCK:
+        cache = _LABEL_CACHE.setdefault(kg_id, OrderedDict())
+        cache.update(fetched)
+        while len(cache) > LABEL_CACHE_SIZE:
+            cache.popitem(last=False)
+    found.update(fetched)
+    return found
+
+
+def invalidate_label_cache(kg_id=None):
+    with _LABEL_CACHE_LOCK:
+        if kg_id is None:
+            _LABEL_CACHE.clear()
+        else:
+            _LABEL_CACHE.pop(kg_id, None)
+
+
+def enrich_labels_by_name(uri, username, password, elements, max_names=200, stats=None):
     """
     For nodes with empty labels_str, look up their Neo4j labels by exact name (case-insensitive)
     and fill labels_str so Cytoscape coloring works even for projected dict results.
     """
     # collect names that need enrichment
     name_to_idx = {}
-    
-    
     for i, el in enumerate(elements):
         d = el.get("data", {})
-        if "source" in d:
-            continue
-        if not d.get("labels_str"):  # empty -> needs enrichment
-            nm = (d.get("label") or "").strip()
-        
-        
-        if d.get("labels_str"):     # already colored
+        if "source" in d or d.get("labels_str"):   # edge, or already colored
             continue
         # use full name if present; fall back to label
         nm = (d.get("name_raw") or d.get("label") or "").strip()
@@ -1191,24 +3736,8 @@ def enrich_labels_by_name(uri, username, password, elements, max_names=200):
     # cap to avoid huge queries
     names = list(name_to_idx.keys())[:max_names]
 
-    driver = GraphDatabase.driver(uri, auth=(username, password))
-    name_to_labels = {}
-    with driver.session() as session:
-        recs = session.run(
-    """
-    UNWIND $names AS nm
-    MATCH (n)
-    WHERE toLower(n.name) = nm
-    WITH nm, collect(distinct labels(n)) AS labsets
-    RETURN nm AS key, (CASE WHEN size(labsets) > 0 THEN labsets[0] ELSE [] END) AS labs
-    """,
-    names=names
-)
-
-        for r in recs:
-            labs = r.get("labs") or []
-            name_to_labels[r["key"]] = labs
-    driver.close()
+    # shared name→labels cache first, then index seeks on name_lc (label-less scan if not migrated)
+    name_to_labels = lookup_labels_by_name(uri, username, password, names, stats=stats)
 
     # write labels back into elements
     for nm_lc, idxs in name_to_idx.items():
@@ -1222,34 +3751,149 @@ def enrich_labels_by_name(uri, username, password, elements, max_names=200):
     return elements
 
 
-def refetch_native_subgraph_by_names(uri, username, password, names, max_names=60):
+_ENRICH_TOTALS = {"requests": 0, "skipped": 0, "nodes": 0, "needing_enrichment": 0, "enriched": 0, "db_round_trips": 0}
+_ENRICH_LOCK = threading.Lock()
+
+
+def enrich_labels_stage(uri, username, password, elements):
+    """
+    Pipeline stage around enrich_labels_by_name: only runs when some node lacks labels_str
+    (Bolt graph results normally carry native labels → zero database round trips), and
+    reports how many nodes needed enrichment. Returns (elements, stats).
+    """
+    t0 = time.perf_counter()
+    nodes = [el["data"] for el in elements if "source" not in el.get("data", {})]
+    needing = [d for d in nodes if not d.get("labels_str")]
+    stats = {"nodes": len(nodes), "needing_enrichment": len(needing), "enriched": 0,
+             "db_round_trips": 0, "cache_hits": 0, "skipped": not needing}
+    if needing:
+        elements = enrich_labels_by_name(uri, username, password, elements, stats=stats)
+        stats["enriched"] = sum(1 for d in needing if d.get("labels_str"))
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    print(f"[enrich] {stats}")
+
+    with _ENRICH_LOCK:
+        _ENRICH_TOTALS["requests"] += 1
+        _ENRICH_TOTALS["skipped"] += int(stats["skipped"])
+        for k in ("nodes", "needing_enrichment", "enriched", "db_round_trips"):
+            _ENRICH_TOTALS[k] += stats[k]
+    return elements, stats
+
+
+def enrichment_metrics():
+    with _ENRICH_LOCK:
+        return dict(_ENRICH_TOTALS)
+
+
+# ---- refetch helpers: element-id / index-backed lookups with a per-call plan report ----
+_ELEMENT_ID_RE = re.compile(r"^\d+:[0-9a-fA-F-]+:\d+$")
+
+
+def _looks_like_element_id(value):
+    """Neo4j 5 element ids look like '4:<db uuid>:<n>' (hash ids made up for projections do not)."""
+    return isinstance(value, str) and bool(_ELEMENT_ID_RE.match(value))
+
+
+def _flatten_profile(plan):
+    """(total db hits, [operator summaries]) of a PROFILE plan (dict tree from the driver)."""
+    total, ops, stack = 0, [], [plan]
+    while stack:
+        p = stack.pop()
+        hits = p.get("dbHits", 0) or 0
+        total += hits
+        ops.append({"operator": p.get("operatorType"), "db_hits": hits, "rows": p.get("rows")})
+        stack.extend(p.get("children") or [])
+    return total, ops
+
+
+def _run_reported(session, query, report, purpose, profile=False, **params):
+    """Run a query (PROFILEd if requested) and append its rows/time/db-hits to `report`."""
+    t0 = time.perf_counter()
+    result = session.run(("PROFILE " if profile else "") + query, params)
+    records = list(result)
+    summary = result.consume()
+    entry = {"purpose": purpose, "rows": len(records), "ms": round((time.perf_counter() - t0) * 1000, 1)}
+    if profile and summary.profile:
+        entry["db_hits"], entry["operators"] = _flatten_profile(summary.profile)
+        report["total_db_hits"] = report.get("total_db_hits", 0) + entry["db_hits"]
+    report.setdefault("queries", []).append(entry)
+    return records
+
+
+def _resolve_names_to_ids(session, names, case_insensitive, report, profile=False, index_labels=None):
+    """
+    {name: [elementId, ...]} for all names in ONE batched lookup: name_lc index seeks when the
+    migration has been applied (`index_labels` from name_lc_index_labels(), resolved by the caller
+    before it opened `session`), otherwise a single pass over the nodes (not one per name/pair).
+    """
+    labels = index_labels
+    if labels:
+        report["strategy"] = "name_lc_index"
+        name_filter = "" if case_insensitive else "WHERE n.name = raw"
+        recs = _run_reported(session, f"""
+            UNWIND $names AS raw
+            WITH raw, toLower(raw) AS nm
+            CALL {{
+                {indexed_name_match(labels)}
+            }}
+            WITH raw, n {name_filter}
+            RETURN raw AS name, collect(elementId(n)) AS ids
+            """, report, "resolve names", profile, names=names)
+        return {r["name"]: list(r["ids"]) for r in recs}
+
+    if case_insensitive:
+        report["strategy"] = "name_scan_once"
+        by_lower = {}
+        for nm in names:
+            by_lower.setdefault(nm.lower(), []).append(nm)
+        recs = _run_reported(session, """
+            MATCH (n) WHERE toLower(n.name) IN $names_lc
+            RETURN toLower(n.name) AS name_lc, collect(elementId(n)) AS ids
+            """, report, "resolve names", profile, names_lc=list(by_lower))
+        out = {}
+        for r in recs:
+            for nm in by_lower.get(r["name_lc"], []):
+                out.setdefault(nm, []).extend(r["ids"])
+        return out
+
+    report["strategy"] = "name_scan_once"
+    recs = _run_reported(session, """
+        MATCH (n) WHERE n.name IN $names
+        RETURN n.name AS name, collect(elementId(n)) AS ids
+        """, report, "resolve names", profile, names=names)
+    return {r["name"]: list(r["ids"]) for r in recs}
+
+
+def refetch_native_subgraph_by_names(uri, username, password, names, max_names=60, with_report=False):
     """
     Graph-only requery: given a list of node names, fetch a,b,r as *native* graph entities.
-    Returns a dash_cytoscape elements list that mirrors Neo4j Browser.
+    Returns a dash_cytoscape elements list that mirrors Neo4j Browser
+    (or (elements, report) with a PROFILE-based db-hits report when with_report=True).
     """
+    report = {}
     if not names:
-        return []
+        return ([], report) if with_report else []
 
     # cap to avoid huge queries
     names = list({(n or "").strip() for n in names if (n or "").strip()})[:max_names]
     if not names:
-        return []
-
-    driver = GraphDatabase.driver(uri, auth=(username, password))
-    with driver.session() as session:
-        recs = session.run(
-            """
-            UNWIND $names AS nm
-            MATCH (a)-[r]-(b)
-            WHERE toLower(a.name) = toLower(nm) OR toLower(b.name) = toLower(nm)
-            RETURN a, r, b
-            """,
-            names=names
-        )
+        return ([], report) if with_report else []
+
+    index_labels = name_lc_index_labels(uri, username, password)
+    with kg_session(uri, username, password) as session:
+        ids_by_name = _resolve_names_to_ids(session, names, True, report, with_report, index_labels)
+        ids = sorted({i for v in ids_by_name.values() for i in v})
+        recs = []
+        if ids:
+            recs = _run_reported(session, """
+                MATCH (a)-[r]-(b) WHERE elementId(a) IN $ids RETURN a, r, b
+                UNION
+                MATCH (a)-[r]-(b) WHERE elementId(b) IN $ids RETURN a, r, b
+                """, report, "expand by element id", with_report, ids=ids)
         records = [rec.data() for rec in recs]
-    driver.close()
 
-    return neo4j_to_cytoscape(records)
+    elements = neo4j_to_cytoscape(records)
+    return (elements, report) if with_report else elements
 
 
 def rebuild_graph_elements_native(uri, username, password, prelim_elements):
@@ -1266,6 +3910,7 @@ def rebuild_graph_elements_native(uri, username, password, prelim_elements):
 def pairs_from_prelim(prelim_elements):
     """
     Extract the exact node-pairs (by name) that appear in the prelim Cytoscape edges.
+    When the prelim nodes carry Neo4j element ids, those are included too (a_id / b_id).
     """
     id2name = {}
     for el in prelim_elements:
@@ -1290,27 +3935,56 @@ def pairs_from_prelim(prelim_elements):
         key = (a, b)
         if key not in seen:
             seen.add(key)
-            pairs.append({"a": a, "b": b})
+            pair = {"a": a, "b": b}
+            if _looks_like_element_id(d["source"]) and _looks_like_element_id(d["target"]):
+                pair["a_id"], pair["b_id"] = d["source"], d["target"]
+            pairs.append(pair)
     return pairs
 
 
-def refetch_native_by_pairs(uri, username, password, pairs):
+def refetch_native_by_pairs(uri, username, password, pairs, with_report=False):
     """
     Requery only the edges between *those* pairs (exactly what Cypher returned).
     No 1-hop neighborhood expansion.
+    Endpoints are found by element id when the pair carries them; the remaining pairs have
+    their names resolved in one batched (index-backed when available) lookup first.
+    With with_report=True returns (elements, report) incl. PROFILE db hits per query.
     """
+    report = {}
     if not pairs:
-        return []
-    driver = GraphDatabase.driver(uri, auth=(username, password))
-    with driver.session() as s:
-        recs = s.run("""
-            UNWIND $pairs AS p
-            MATCH (a {name:p.a})-[r]-(b {name:p.b})
-            RETURN a, r, b
-        """, pairs=pairs)
+        return ([], report) if with_report else []
+
+    id_pairs = [{"a": p["a_id"], "b": p["b_id"]} for p in pairs if p.get("a_id") and p.get("b_id")]
+    name_pairs = [p for p in pairs if not (p.get("a_id") and p.get("b_id"))]
+
+    index_labels = name_lc_index_labels(uri, username, password) if name_pairs else None
+    with kg_session(uri, username, password) as s:
+        if name_pairs:
+            names = sorted({p["a"] for p in name_pairs} | {p["b"] for p in name_pairs})
+            ids_by_name = _resolve_names_to_ids(s, names, False, report, with_report, index_labels)
+            seen = {(p["a"], p["b"]) for p in id_pairs}
+            for p in name_pairs:
+                for a_id in ids_by_name.get(p["a"], []):
+                    for b_id in ids_by_name.get(p["b"], []):
+                        if (a_id, b_id) not in seen:
+                            seen.add((a_id, b_id))
+                            id_pairs.append({"a": a_id, "b": b_id})
+        recs = []
+        if id_pairs:
+            recs = _run_reported(s, """
+                UNWIND $pairs AS p
+                MATCH (a) WHERE elementId(a) = p.a
+                MATCH (b) WHERE elementId(b) = p.b
+                MATCH (a)-[r]-(b)
+                RETURN a, r, b
+                """, report, "edges between pairs", with_report, pairs=id_pairs)
         records = [rec.data() for rec in recs]
-    driver.close()
-    return neo4j_to_cytoscape(records)
+
+    if with_report:
+        print(f"[refetch] {report.get('strategy', 'element_id')} db_hits={report.get('total_db_hits')} "
+              f"queries={[(q['purpose'], q['rows'], q.get('db_hits')) for q in report.get('queries', [])]}")
+    elements = neo4j_to_cytoscape(records)
+    return (elements, report) if with_report else elements
 
 
 # --- exact Neo4j-Browser-style elements from the same Cypher ---
@@ -1375,10 +4049,8 @@ def browser_exact_elements(uri, username, password, cypher):
 
     print("\n[viz] Rewritten viz query:\n", viz_q, "\n")
 
-    driver = GraphDatabase.driver(uri, auth=(username, password))
-    with driver.session() as s:
+    with kg_session(uri, username, password) as s:
         recs = s.run(viz_q).data()
-    driver.close()
 
     # recs look like [{'ns':[Node,...],'rs':[Rel,...]}, ...]
     
@@ -1551,11 +4223,8 @@ def build_viz_query_from_cypher(cypher: str):
 
 
 def assert_counts_match(uri, username, password, cypher, elements):
-    from neo4j import GraphDatabase
-    driver = GraphDatabase.driver(uri, auth=(username, password))
-    with driver.session() as s:
+    with kg_session(uri, username, password) as s:
         recs = s.run(cypher).data()
-    driver.close()
 
     # Count native entities in raw result
     def walk(v, nodes, rels):
@@ -1944,9 +4613,45 @@ def neo4j_to_cytoscape_exact(records):
     return elements
 
 
-def safe_json(obj):   
-    from neo4j.graph import Node, Relationship
-    import json
+# ---- JSON serialization (results pane, LLM payload) ----
+
+
+def _json_default(o):
+    """Serializer hook for the Neo4j types json/orjson don't know (called only for those values)."""
+    if isinstance(o, Node):
+        return {"node_id": o.element_id, "labels": list(o.labels), **dict(o)}
+    if isinstance(o, Relationship):
+        return {"rel_id": o.element_id, "type": o.type,
+                "start": o.start_node.element_id if o.start_node is not None else None,
+                "end": o.end_node.element_id if o.end_node is not None else None, **dict(o)}
+    if isinstance(o, Path):
+        return {"nodes": list(o.nodes), "relationships": list(o.relationships)}
+    if isinstance(o, (neo4j_time.Date, neo4j_time.Time, neo4j_time.DateTime)):
+        return o.iso_format()
+    if isinstance(o, neo4j_spatial.Point):
+        return {"srid": o.srid, "coordinates": list(o)}
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    return str(o)  # Duration and anything else exotic
+
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS
+
+    def safe_json(obj, compact=False):
+        """Single-pass JSON text (indent=2 unless compact) for query results incl. Neo4j types."""
+        opts = _ORJSON_OPTS if compact else _ORJSON_OPTS | orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_json_default, option=opts).decode()
+else:
+    def safe_json(obj, compact=False):
+        """Single-pass JSON text (indent=2 unless compact) for query results incl. Neo4j types."""
+        if compact:
+            return json.dumps(obj, default=_json_default, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(obj, default=_json_default, ensure_ascii=False, indent=2)
+
+
+def _safe_json_legacy(obj):
+    """The previous two-pass implementation, unchanged, kept only as the --bench-json baseline."""
     def coerce(o):
         if isinstance(o, Node):
             return {"node_id": o.id, "labels": list(o.labels), **dict(o)}
@@ -1964,15 +4669,192 @@ def safe_json(obj):
         return json.dumps(coerce(obj), indent=2)
 
 
+def _bench_rows(n):
+    """Synthetic result rows shaped like the KG answers: node entities, scalars, evidence lists."""
+    from neo4j.graph import Graph
+    graph = Graph()
+    rows = []
+    for i in range(n):
+        node = Node(graph, f"4:bench:{i}", i, ["Gene", "Protein"],
+                    {"name": f"GENE{i}", "name_lc": f"gene{i}", "source": "bench"})
+        rows.append({"n": node, "name": f"GENE{i}", "score": i / 7,
+                     "pmids": [str(30000000 + i + k) for k in range(5)],
+                     "evidence": "Gene expression was associated with disease progression. " * 3})
+    return rows
+
+
+def bench_json(n_rows=5000, repeat=5):
+    """Compare safe_json with the legacy implementation and the element transport engines."""
+    def best_ms(fn, *args):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(*args)
+            best = min(best, time.perf_counter() - t0)
+        return round(best * 1000, 2)
+
+    typed = _bench_rows(n_rows)
+    plain = [{k: (dict(v) if isinstance(v, Node) else v) for k, v in row.items()} for row in typed]
+    print(f"safe_json backend: {'orjson' if orjson is not None else 'json'}; {n_rows} rows, best of {repeat}")
+    for label, rows in (("plain rows", plain), ("rows with Node values", typed)):
+        print(f"  {label:24s} legacy {best_ms(_safe_json_legacy, rows):9.2f} ms   "
+              f"safe_json {best_ms(safe_json, rows):9.2f} ms   "
+              f"compact {best_ms(safe_json, rows, True):9.2f} ms")
+
+    import plotly.io.json as pio_json
+    elements = [{"data": {"id": f"4:bench:{i}", "label": f"GENE{i}", "labels_str": "Gene|Protein"}}
+                for i in range(n_rows)]
+    elements += [{"data": {"id": f"e{i}", "source": f"4:bench:{i}", "target": f"4:bench:{(i + 1) % n_rows}",
+                           "label": "ASSOCIATED_WITH", "evidence": "…" * 40}} for i in range(n_rows)]
+    for engine in ("json", "orjson"):
+        if engine == "orjson" and orjson is None:
+            continue
+        print(f"  elements via {engine:7s}       {best_ms(pio_json.to_json_plotly, elements, False, engine):9.2f} ms")
+
+
+class JsonArrayWriter:
+    """
+    Renders a list of rows as the same indented JSON array safe_json(rows) would produce,
+    one row at a time, so the results pane can be built (and pushed) while rows stream in.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, row):
+        self.parts.append("  " + safe_json(row).replace("\n", "\n  "))
+
+    def __len__(self):
+        return len(self.parts)
+
+    def getvalue(self, truncated=False):
+        if not self.parts:
+            return "[]"
+        text = "[\n" + ",\n".join(self.parts) + "\n]"
+        if truncated:
+            text += (f"\n\n… result truncated after {len(self.parts)} rows "
+                     f"({truncated} limit, see CGEX_QUERY_MAX_ROWS / CGEX_QUERY_MAX_MB)")
+        return text
+
+
+# ---- boot warm-up + health probe ----
+# With CGEX_WARMUP on (default), the serving process warms every configured KG in the background
+# right after start: a pooled connection is opened, the schema is extracted into the schema cache
+# and the prompt template is pre-rendered, so the first user of a KG doesn't pay for it.
+# /healthz reports per-KG readiness and how long each warm-up step took.
+WARMUP_ENABLED = os.getenv("CGEX_WARMUP", "1").lower() not in ("0", "false", "no", "off")
+
+_WARMUP = {}   # kg_id (or "llm") -> {"status", "steps_s", "started_at", "finished_at", "error"}
+_WARMUP_LOCK = threading.Lock()
+
+
+def _warm_up_kg(kg_id, cfg):
+    state = {"status": "warming", "steps_s": {}, "started_at": time.time(), "finished_at": None, "error": None}
+    with _WARMUP_LOCK:
+        _WARMUP[kg_id] = state
+    uri, username, password = cfg["uri"], cfg["username"], cfg["password"]
+    try:
+        with stage_timer(state["steps_s"], "connect"):
+            with kg_session(uri, username, password) as session:
+                session.run("RETURN 1").consume()
+        with stage_timer(state["steps_s"], "schema"):
+            entry = get_schema_entry(uri, username, password)
+        if not entry["schema"].get("nodes") and not entry["schema"].get("relationships"):
+            # extract_schema logged its error and returned the empty fallback: prompts would be blind
+            state.update(status="degraded", error="schema extraction returned an empty schema")
+        else:
+            with stage_timer(state["steps_s"], "prompt_template"):
+                get_prompt_template(uri, username, password, kg_name=cfg["name"])
+            gazetteer_for(uri, username, password)  # first build continues in its own thread
+            state["status"] = "ready"
+    except Exception as e:
+        print(f"⚠️ Warm-up of {kg_id} failed: {e}")
+        state.update(status="error", error=str(e))
+    state["finished_at"] = time.time()
+    print(f"[warmup] {kg_id} {state['status']} {state['steps_s']}")
+
+
+def _warm_up_llm():
+    state = {"status": "warming", "steps_s": {}, "started_at": time.time(), "finished_at": None, "error": None}
+    with _WARMUP_LOCK:
+        _WARMUP["llm"] = state
+    try:
+        with stage_timer(state["steps_s"], "client"):
+            get_llm()
+        state["status"] = "ready"
+    except Exception as e:
+        state.update(status="error", error=str(e))
+    state["finished_at"] = time.time()
+
+
+def start_warmup():
+    """Warm every configured KG (and the LLM client) in background threads; no-op if CGEX_WARMUP is off."""
+    if not WARMUP_ENABLED:
+        return []
+    threads = [threading.Thread(target=_warm_up_kg, args=(kg_id, cfg), name=f"warmup-{kg_id}", daemon=True)
+               for kg_id, cfg in KG_CONFIGS.items() if cfg["uri"]]
+    threads.append(threading.Thread(target=_warm_up_llm, name="warmup-llm", daemon=True))
+    for t in threads:
+        t.start()
+    return threads
+
+
+@app.server.route("/healthz")
+def healthz_endpoint():
+    """Per-KG readiness: 200 once every configured KG is warmed up (or warm-up is off), else 503."""
+    with _WARMUP_LOCK:
+        warmup = {k: dict(v, steps_s=dict(v["steps_s"])) for k, v in _WARMUP.items()}
+    kgs = {}
+    for kg_id, cfg in KG_CONFIGS.items():
+        if not cfg["uri"]:
+            kgs[kg_id] = {"status": "not_configured"}
+            continue
+        entry = peek_schema_entry(kg_id)
+        state = warmup.get(kg_id) or {"status": "cold" if not WARMUP_ENABLED else "pending"}
+        kgs[kg_id] = dict(state, schema_cached=entry is not None,
+                          schema_age_s=round(time.time() - entry["fetched_at"], 1) if entry else None)
+    statuses = {v["status"] for v in kgs.values() if v["status"] != "not_configured"}
+    if not WARMUP_ENABLED:
+        overall = "ok"
+    elif statuses <= {"ready"}:
+        overall = "ok"
+    elif statuses & {"error", "degraded"}:
+        overall = "degraded"
+    else:
+        overall = "starting"
+    body = {"status": overall, "warmup_enabled": WARMUP_ENABLED, "kgs": kgs, "llm": warmup.get("llm"),
+            "startup": STARTUP_REPORT}
+    return jsonify(body), (200 if overall == "ok" else 503)
+
+
+# ---- monitoring ----
+@app.server.route("/metrics")
+def metrics_endpoint():
+    """JSON metrics for monitoring (Neo4j connection pools, LLM token usage)."""
+    return jsonify({
+        "neo4j_pools": pool_metrics(),
+        "llm_usage": llm_usage_metrics(),
+        "question_cache": QUESTION_CACHE.metrics(),
+        "result_cache": RESULT_CACHE.metrics(),
+        "jobs": job_metrics(),
+        "label_enrichment": enrichment_metrics(),
+        "fast_path": fastpath_metrics(),
+        "gazetteer": gazetteer_metrics(),
+        "startup": STARTUP_REPORT,
+    })
+
 
 # 🧠 Update callback to take dropdown input
 # 🧠 Update callback to take dropdown input
+# Submit/Disapprove only start a background pipeline job; poll_pipeline_job fills in the outputs.
 @app.callback(
     Output('generated-cypher', 'children'),
     Output('detailed-response', 'children'),
     Output('cypher-results', 'children'),
     Output('cypher-prompt', 'children'),
     Output('solution-graph', 'elements'),      # 👈 NEW
+    Output('pipeline-job', 'data'),
+    Output('job-poll', 'disabled'),
     Input('submit-question', 'n_clicks'),
     Input('approve-cypher', 'n_clicks'),
     Input('disapprove-cypher', 'n_clicks'),
@@ -1980,15 +4862,17 @@ def safe_json(obj):
     State('kg-selector', 'value'),
     State('generated-cypher', 'children'),
     State('cypher-prompt', 'children'),
+    State('pipeline-job', 'data'),
     prevent_initial_call=True
 )
 
-def update_output(submit_clicks, approve_clicks, disapprove_clicks, question, selected_kg, generated_cypher, cypher_prompt):
+def update_output(submit_clicks, approve_clicks, disapprove_clicks, question, selected_kg, generated_cypher, cypher_prompt,
+                  job_data=None):
     ctx = dash.callback_context
 
     if not ctx.triggered:
         #return '', '', '', ''
-        return '', '', '', '', dash.no_update
+        return '', '', '', '', dash.no_update, dash.no_update, dash.no_update
 
 
     button_id = ctx.triggered[0]['prop_id'].split('.')[0]
@@ -1999,73 +4883,104 @@ def update_output(submit_clicks, approve_clicks, disapprove_clicks, question, se
     # else:
     #     graph, chain = graph_2, cypher_chain_2
     
-    if selected_kg == 'kg1':
-        uri, username, password = NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
-        http_url = NEO4J_HTTP_URI
-        graph = graph_1
-    else:
-        uri, username, password = NEO4J_URI_2, NEO4J_USERNAME_2, NEO4J_PASSWORD_2
-        http_url = NEO4J_HTTP_URI_2
-        graph = graph_2
+    kg_cfg = KG_CONFIGS['kg1'] if selected_kg == 'kg1' else KG_CONFIGS['kg2']
+    uri, username, password = kg_cfg["uri"], kg_cfg["username"], kg_cfg["password"]
+    kg_name = kg_cfg["name"]
 
 
     # 💡 Extract the dynamic schema and build the prompt
     #schema = extract_schema(uri, username, password)
     #prompt_template = build_prompt_template(schema["nodes"], schema["relationships"])
-    
-    schema = extract_schema(uri, username, password)
 
-    if selected_kg == 'kg1':
-        kg_name = "COVID–NDD CBM KG"
-    else:
-        kg_name = "COVID–NDD Negin KG"
+    def _prompt_template():
+        # only the generating paths need the schema (Approve does not); schema and template are cached
+        return get_prompt_template(uri, username, password, kg_name=kg_name)
 
-    prompt_template = build_prompt_template(schema["nodes"], schema["relationships"], kg_name=kg_name)
+    def _schema_version():
+        entry = peek_schema_entry(kg_id_for_uri(uri))
+        return entry["fingerprint"] if entry else None
 
-
-    # 💡 Create a Cypher QA chain with the dynamic prompt
-    # cypher_chain = GraphCypherQAChain.from_llm(
-    #     llm, graph=graph, cypher_prompt=prompt_template,
-    #     verbose=True, allow_dangerous_requests=True,
-    #     return_intermediate_steps=True
-    #     )
+    def _start(use_few_shot):
+        # a newer question supersedes whatever this browser was still waiting for
+        if job_data and job_data.get("id"):
+            cancel_pipeline_job(job_data["id"])
+        prompt_template = _prompt_template()
+        job_id = start_pipeline_job(question, uri, username, password, prompt_template=prompt_template,
+                                    use_few_shot=use_few_shot, schema_version=_schema_version())
+        # clear the previous answer and start polling the new job
+        return '', 'Generating…', '', '', [], {"id": job_id}, False
 
 
     if button_id == 'submit-question' and question:
         #cypher_prompt, generated_cypher, cypher_results, detailed_response = query_kg(question, graph, chain)
-        #cypher_prompt, generated_cypher, cypher_results, detailed_response = query_kg(question, graph, cypher_chain)
-        # formatted_prompt_str = prompt_template.format(question=question)
-        # cypher_prompt, generated_cypher, cypher_results, detailed_response = query_kg(question, graph, cypher_chain, prompt_str=formatted_prompt_str)
-        cypher_prompt, generated_cypher, cypher_results, detailed_response, elements = run_pipeline_direct(
-         question, graph, uri, http_url, username, password, prompt_template, use_few_shot=False
-)
-
-        return generated_cypher, detailed_response, cypher_results, cypher_prompt, elements
+        return _start(use_few_shot=False)
 
     elif button_id == 'approve-cypher' and generated_cypher:
-        save_example(EXAMPLES_FILE_PATH, question, generated_cypher)
-        return generated_cypher, 'Cypher query approved and saved.', '', cypher_prompt, dash.no_update
+        saved = save_example(EXAMPLES_FILE_PATH, question, generated_cypher)
+        # approved translations seed the question cache (only if the schema is already cached)
+        if _schema_version():
+            QUESTION_CACHE.put(kg_id_for_uri(uri), _schema_version(), question, generated_cypher, source="approved")
+        status = 'Cypher query approved and saved.' if saved else 'Cypher query approved (already saved as an example).'
+        return generated_cypher, status, '', cypher_prompt, dash.no_update, dash.no_update, dash.no_update
 
 
     elif button_id == 'disapprove-cypher':
         examples = load_examples(EXAMPLES_FILE_PATH)
         if examples:
             #cypher_prompt, generated_cypher, cypher_results, detailed_response = query_kg(question, graph, chain, use_few_shot=True)
-            #cypher_prompt, generated_cypher, cypher_results, detailed_response = query_kg(question, graph, cypher_chain, use_few_shot=True)
-            # formatted_prompt_str = prompt_template.format(question=question)
-            # cypher_prompt, generated_cypher, cypher_results, detailed_response = query_kg(question, graph, cypher_chain, use_few_shot=True, prompt_str=formatted_prompt_str)
-            cypher_prompt, generated_cypher, cypher_results, detailed_response, elements = run_pipeline_direct(
-    question, graph, uri, http_url, username, password, prompt_template, use_few_shot=True
-)
-            
-    
-            return generated_cypher, detailed_response, cypher_results, cypher_prompt, elements
+            return _start(use_few_shot=True)
         else:
             #return '', 'Cypher query disapproved. No examples available for few-shot learning.', '', ''
-            return '', 'Cypher query disapproved. No examples available for few-shot learning.', '', '', dash.no_update
+            return '', 'Cypher query disapproved. No examples available for few-shot learning.', '', '', dash.no_update, dash.no_update, dash.no_update
 
     #return '', '', '', ''
-    return '', '', '', '', []
+    return '', '', '', '', [], dash.no_update, dash.no_update
+
+
+@app.callback(
+    Output('generated-cypher', 'children', allow_duplicate=True),
+    Output('detailed-response', 'children', allow_duplicate=True),
+    Output('cypher-results', 'children', allow_duplicate=True),
+    Output('cypher-prompt', 'children', allow_duplicate=True),
+    Output('solution-graph', 'elements', allow_duplicate=True),
+    Output('pipeline-job-seen', 'data'),
+    Input('job-poll', 'n_intervals'),
+    State('pipeline-job', 'data'),
+    State('pipeline-job-seen', 'data'),
+    prevent_initial_call=True
+)
+def poll_pipeline_job(n_intervals, job_data, seen_data):
+    """Push whatever the current job has produced since the last poll (only changed outputs)."""
+    job_id = (job_data or {}).get("id")
+    job = get_pipeline_job(job_id)
+    if job is None or job.cancel_event.is_set():
+        # superseded or expired: never let it overwrite the outputs of a newer job
+        return (dash.no_update,) * 5 + ({"id": job_id, "seen": {}, "done": True},)
+
+    snap = job.snapshot()
+    seen = dict((seen_data or {}).get("seen") or {}) if (seen_data or {}).get("id") == job.id else {}
+    out = []
+    for field in JOB_FIELDS:
+        if snap["versions"][field] != seen.get(field, 0):
+            value = snap["values"][field]
+            out.append(value if value is not None else ([] if field == "elements" else ''))
+            seen[field] = snap["versions"][field]
+        else:
+            out.append(dash.no_update)
+    finished = snap["status"] not in ("queued", "running")
+    return tuple(out) + ({"id": job.id, "seen": seen, "done": finished},)
+
+
+@app.callback(
+    Output('job-poll', 'disabled', allow_duplicate=True),
+    Input('pipeline-job-seen', 'data'),
+    State('pipeline-job', 'data'),
+    prevent_initial_call=True
+)
+def stop_job_poll(seen_data, job_data):
+    """Stop polling once the current job is done; a late poll answer for an older job never stops it."""
+    current = (job_data or {}).get("id")
+    return bool(seen_data and seen_data.get("done") and seen_data.get("id") == current)
 
 
 @app.callback(
@@ -2091,9 +5006,54 @@ def show_edge_evidence(edge_data):
 
 
 
+def _in_serving_process(debug):
+    # With debug=True the Werkzeug reloader runs this script twice; only the child serves.
+    return not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+
+_startup_mark("module")
+
+
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="CGEx: Cypher Generating Expert")
+    parser.add_argument("--bench-json", nargs="?", const=5000, type=int, metavar="ROWS",
+                        help="benchmark result/element serialization on ROWS synthetic rows, then exit")
+    parser.add_argument("--create-fulltext-index", metavar="KG", choices=sorted(KG_CONFIGS),
+                        help=f"opt-in: create the {FULLTEXT_INDEX_NAME} full-text index on this KG, then exit")
+    parser.add_argument("--check-fulltext", metavar="KG", choices=sorted(KG_CONFIGS),
+                        help="compare result sets and latency of the full-text rewrite on the examples, then exit")
+    parser.add_argument("--migrate-name-index", metavar="KG", choices=sorted(KG_CONFIGS),
+                        help="opt-in: store lowercase names (name_lc) and index them on this KG, then exit")
+    args = parser.parse_args()
+
+    if args.bench_json:
+        bench_json(args.bench_json)
+        sys.exit(0)
+
+    if args.create_fulltext_index:
+        cfg = KG_CONFIGS[args.create_fulltext_index]
+        create_fulltext_index(cfg["uri"], cfg["username"], cfg["password"])
+        sys.exit(0)
+
+    if args.check_fulltext:
+        cfg = KG_CONFIGS[args.check_fulltext]
+        check_fulltext_rewrite(cfg["uri"], cfg["username"], cfg["password"])
+        sys.exit(0)
+
+    if args.migrate_name_index:
+        cfg = KG_CONFIGS[args.migrate_name_index]
+        migrate_name_lc_index(cfg["uri"], cfg["username"], cfg["password"])
+        sys.exit(0)
+
+    DEBUG = True
+    if _in_serving_process(DEBUG):
+        print(f"[startup] cgex loaded in {STARTUP_REPORT['phases_s']['module']}s "
+              f"(phases: {STARTUP_REPORT['phases_s']}); LLM and KG clients connect on first use")
+        start_schema_refresher()
+        start_warmup()
     #app.run_server(debug=True)
-    app.run(debug=True)
+    app.run(debug=DEBUG)
     #app.run_server(debug=False)
     
     